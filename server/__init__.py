@@ -8,6 +8,7 @@ from flask_session import Session
 import json, queue
 
 from server.simulate import aquarium_simulation
+from server.broadcast import WireJSON
 from server.helper import settings, store_items, format_number, dict_to_html, load_latest_from_s3
 from server.models.user import User, GuestUser, UserManager
 from server.models.aquarium import Aquarium
@@ -25,7 +26,8 @@ def create_app():
     Session(app)
 
     # Set up Flask-SocketIO
-    socketio = SocketIO(app, manage_session=False)
+    # WireJSON sends the payloads the broadcaster already encoded as they are (see server/broadcast.py)
+    socketio = SocketIO(app, manage_session=False, json=WireJSON)
 
     # Set up Flask-Login
     login_manager = LoginManager()
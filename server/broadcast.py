@@ -0,0 +1,391 @@
+# Sends the state of the aquarium to the clients connected to /aquarium (check `docs/socketio.md`)
+# The simulation loop hands us what changed every tick and we decide how it goes over the wire.
+import json, struct, time, os, collections
+
+BATCH_UPDATES = True # One update_things message per tick instead of an update_thing per changed Thing
+DELTA_UPDATES = True # Only send the fields that changed since a Thing was last broadcast (needs BATCH_UPDATES)
+PACKED_SYNC = True # Let clients ask for sync_everything in the binary format below (see the sync_format event)
+ENCODE_ONCE = True # Encode each Thing's JSON once until it changes, and each sync_everything once per tick (needs WireJSON)
+SEQUENCED_STREAM = True # Number update_things and keyframes so clients can spot gaps and resume (needs BATCH_UPDATES)
+
+# Keyframes (a sync_everything to everyone) go out once the deltas since the last one add up to KEYFRAME_DELTA_RATIO
+# of a keyframe (in fields), but never more often than KEYFRAME_MIN_INTERVAL or less often than KEYFRAME_MAX_INTERVAL
+# Without SEQUENCED_STREAM there's one every KEYFRAME_MIN_INTERVAL
+KEYFRAME_MIN_INTERVAL = 1 # seconds
+KEYFRAME_MAX_INTERVAL = 10 # seconds
+KEYFRAME_DELTA_RATIO = 1.0
+HISTORY_LENGTH = 400 # update_things we keep for clients that resume (20 seconds at 20 ticks a second)
+
+# Binary ("packed") sync_everything format, for clients that ask for it
+# A header, then a table of every string used (once each), then one fixed-width record per Thing:
+#   header:  b"AQP" + version (1 byte), string count (uint32), record count (uint32)
+#   strings: length (uint32) + UTF-8 bytes, for each string
+#   records: every field in PACKED_NUMBERS, then a uint16 index into the strings for every field in PACKED_STRINGS
+# Everything is little-endian. Numbers that are missing (or None) are NaN. String fields are PACKED_ABSENT if the
+# Thing doesn't have them and PACKED_NULL if they're None. "json" strings hold JSON (lists, dictionaries) and
+# "extra" holds every field that isn't in the schema (like top_relationships) as one JSON object.
+PACKED_VERSION = 2
+PACKED_NUMBERS = [ # (field, struct format)
+    # float32 ("f") only for pixels and geometry, everything else has to come back exactly like the JSON sync
+    # (value is money, a 0.01 coin would be 0.009999999776 as a float32)
+    ("x", "f"), ("y", "f"), ("destination_x", "f"), ("destination_y", "f"), ("speed", "f"),
+    ("width", "f"), ("height", "f"), ("aspect_ratio", "f"), ("time_created", "d"), ("update_time", "d"),
+    ("version", "d"), ("health", "d"), ("happiness", "d"), ("hunger", "d"), ("nutrition", "d"), ("value", "d"),
+]
+PACKED_STRINGS = [ # (field, "string" or "json")
+    ("label", "string"), ("class_hierarchy", "json"), ("spritesheet_json", "string"), ("default_texture", "string"),
+    ("default_animation", "string"), ("animation_prefix", "string"), ("state", "string"), ("fish_name", "string"),
+    ("username", "string"), ("closed_texture", "string"), ("empty_texture", "string"), ("full_texture", "string"),
+    ("extra", "json"),
+]
+PACKED_ABSENT = 0xFFFF
+PACKED_NULL = 0xFFFE
+PACKED_RECORD = struct.Struct("<" + "".join(code for _, code in PACKED_NUMBERS) + "H" * len(PACKED_STRINGS))
+PACKED_HEADER = struct.Struct("<3sBII")
+PACKED_SCHEMA = { # Sent to clients (sync_schema) so they can decode the records
+    "version": PACKED_VERSION,
+    "numbers": PACKED_NUMBERS,
+    "strings": PACKED_STRINGS,
+    "record_size": PACKED_RECORD.size,
+    "absent": PACKED_ABSENT,
+    "null": PACKED_NULL,
+}
+PACKED_NUMBER_FIELDS = [field for field, _ in PACKED_NUMBERS]
+PACKED_FIELDS = set(PACKED_NUMBER_FIELDS) | {field for field, _ in PACKED_STRINGS}
+
+def pack_things(things) -> bytes:
+    # Encode a list of Thing summaries in the packed format
+    strings = {} # {string: index}
+    json_strings = {} # {repr of a list or dictionary: its JSON} (the same class_hierarchy shows up a lot)
+    def string_index(value, kind):
+        if value is None:
+            return(PACKED_NULL)
+        if kind == "json":
+            key = repr(value)
+            encoded = json_strings.get(key)
+            if encoded is None:
+                encoded = json_strings[key] = json.dumps(value, separators=(",", ":"))
+            value = encoded
+        index = strings.get(value)
+        if index is None:
+            index = strings[value] = len(strings)
+            if index >= PACKED_NULL:
+                raise ValueError("Too many strings for the packed format")
+        return(index)
+
+    nan = float("nan")
+    record = PACKED_RECORD
+    records = bytearray(record.size * len(things))
+    for i, thing in enumerate(things):
+        values = [nan if value is None else value for value in map(thing.get, PACKED_NUMBER_FIELDS)]
+        for field, kind in PACKED_STRINGS:
+            if field == "extra":
+                extra_fields = thing.keys() - PACKED_FIELDS
+                values.append(string_index({key: thing[key] for key in extra_fields}, kind) if extra_fields else PACKED_ABSENT)
+            elif field in thing:
+                values.append(string_index(thing[field], kind))
+            else:
+                values.append(PACKED_ABSENT)
+        record.pack_into(records, i * record.size, *values)
+
+    encoded = [string.encode("utf-8") for string in strings]
+    parts = [PACKED_HEADER.pack(b"AQP", PACKED_VERSION, len(encoded), len(things))]
+    for string in encoded:
+        parts.append(struct.pack("<I", len(string)))
+        parts.append(string)
+    parts.append(records)
+    return(b"".join(parts))
+
+# JSON we've already encoded ourselves, for WireJSON to paste into the packet as it is
+class EncodedJSON():
+    __slots__ = ("text",)
+
+    def __init__(self, text):
+        self.text = text
+
+# The json "module" Socket.IO encodes packets with (SocketIO(json=WireJSON) in server/__init__.py)
+# It's the standard json module, except EncodedJSON arguments aren't encoded again
+class WireJSON():
+    @staticmethod
+    def dumps(data, **kwargs):
+        if isinstance(data, list) and any(isinstance(item, EncodedJSON) for item in data):
+            separator = kwargs.get("separators", (", ", ": "))[0]
+            return("[" + separator.join(item.text if isinstance(item, EncodedJSON) else json.dumps(item, **kwargs) for item in data) + "]")
+        return(json.dumps(data, **kwargs))
+
+    @staticmethod
+    def loads(*args, **kwargs):
+        return(json.loads(*args, **kwargs))
+
+encode_json = json.JSONEncoder(separators=(",", ":")).encode
+
+def merge_updates(updates) -> list:
+    # Keep only the latest summary of each Thing (in the order they first changed)
+    # Every summary has all of the Thing's properties, so the latest one is all a client needs
+    # (and a removal is always the last thing that happens to a Thing)
+    merged = {}
+    for update in updates:
+        merged[update["label"]] = update
+    return(list(merged.values()))
+
+class Broadcaster():
+    def __init__(self, socketio, namespace="/aquarium", batch_updates=BATCH_UPDATES, delta_updates=DELTA_UPDATES,
+                 encode_once=ENCODE_ONCE, sequenced=SEQUENCED_STREAM, history_length=HISTORY_LENGTH):
+        self.socketio = socketio
+        self.namespace = namespace
+        self.batch_updates = batch_updates
+        self.delta_updates = delta_updates and batch_updates
+        self.encode_once = encode_once
+        self.sequenced = sequenced and batch_updates
+        # The stream: every keyframe and update_things gets the next sequence number (seq). Clients send back the
+        # last one they got (with the stream, which is new every time the server starts) to resume (see resume)
+        self.stream = os.urandom(4).hex()
+        self.seq = 0
+        self.keyframe_seq = 0 # seq of the last keyframe
+        self.history = collections.deque(maxlen=history_length) # [(seq, update_things payload)] since the last keyframe
+        self.last_keyframe_time = None # aquarium.now (ms)
+        self.keyframe_fields = 0 # Size of the last keyframe (fields in all its records)
+        self.delta_fields = 0 # Fields in every update_things since then
+        # What every client has been sent for each Thing: {label: [version, summary, record]}
+        # (everyone gets the same broadcasts, and new clients start with a sync_everything)
+        self.sent = {}
+        # The JSON of each Thing's last sync_everything record: {label: (record, JSON)}
+        # Sleeping Things hand us the same summary (and so the same record) until they change, so we reuse the JSON
+        self.encoded = {}
+        # Everything we've built for this tick's syncs, reused by every sync until the aquarium moves on:
+        # {(kind, "records"): [...], (kind, format): payload} for the "sync" and "snapshot" kinds
+        self.sync_payloads = {}
+        self.sync_time = None # aquarium.now when sync_payloads was built
+
+        # Stats
+        self.messages = 0 # Socket.IO messages sent
+        self.updates = 0 # Thing summaries sent (after merging)
+        self.encode_time = 0.0 # Seconds spent building and encoding payloads (total)
+        self.ticks = 0 # Ticks we broadcast something on
+        self.last_tick = None # The tick (or aquarium.now) we last encoded something for
+        self.tick_encode_time = 0.0 # Seconds spent on last_tick
+        self.worst_encode_time = 0.0 # Seconds (since the last report)
+        self.encode_time_at_last_report = 0.0
+        self.ticks_at_last_report = 0
+        self.keyframes = 0
+        self.resumed = 0 # Clients we caught up from the history
+        self.resume_fallbacks = 0 # Clients that wanted to resume but got a snapshot (the history was gone)
+
+    def keyframe_due(self, aquarium) -> bool:
+        # Time for a sync_everything to everyone?
+        if self.last_keyframe_time is None:
+            return(True)
+        elapsed = (aquarium.now - self.last_keyframe_time) / 1000
+        if elapsed < KEYFRAME_MIN_INTERVAL:
+            return(False)
+        if (elapsed >= KEYFRAME_MAX_INTERVAL) or not self.sequenced:
+            return(True)
+        # Once resuming from the history would cost more than a keyframe, or the history is full
+        return((self.delta_fields >= self.keyframe_fields * KEYFRAME_DELTA_RATIO) or (len(self.history) == self.history.maxlen))
+
+    def sync_everything(self, aquarium, tick, formats=None):
+        # A keyframe on simulation tick number `tick`: every Thing in the aquarium, in full (clients remove whatever isn't in here)
+        # `formats` are the ones the viewers asked for ("json", "packed"), each is sent to the room of that name
+        # (None sends JSON to everyone)
+        start = time.perf_counter()
+        payloads = [(format, self._sync_payload(aquarium, "sync", format or "json")) for format in ([None] if formats is None else formats)]
+        self._record_encode_time(start, tick)
+        if self.sequenced:
+            self.seq += 1
+            self.keyframe_seq = self.seq
+            self.history.clear() # Nobody can resume from before a keyframe (see resume)
+            self.keyframe_fields = sum(map(len, self.sync_payloads.get(("sync", "records"), [])))
+            self.delta_fields = 0
+        self.last_keyframe_time = aquarium.now
+        self.keyframes += 1
+        for format, payload in payloads:
+            if format is None:
+                self._emit_sync(payload)
+            else:
+                self._emit_sync(payload, to=format)
+            self.updates += len(aquarium.objects)
+
+    def _emit_sync(self, payload, **kwargs):
+        # sync_everything, with where it puts the client in the stream as a second argument
+        if self.sequenced:
+            self.socketio.emit("sync_everything", payload, {"stream": self.stream, "seq": self.seq}, namespace=self.namespace, **kwargs)
+        else:
+            self.socketio.emit("sync_everything", payload, namespace=self.namespace, **kwargs)
+        self.messages += 1
+
+    def resume(self, aquarium, sid, tick, format="json", position=None):
+        # Catch up a client that was last at `position` ({"stream", "seq"}, None for a new client) in the stream
+        # If every update_things it missed is still in the history we send it those, otherwise a snapshot (sync_to)
+        # The history starts over at every keyframe, deltas from before one can't be mixed with deltas after it
+        if self.sequenced and position and (position.get("stream") == self.stream):
+            seq = position.get("seq")
+            if isinstance(seq, int) and (self.keyframe_seq <= seq <= self.seq):
+                missed = [payload for message_seq, payload in self.history if message_seq > seq]
+                if len(missed) == self.seq - seq: # Nothing's been pushed out of the history
+                    for payload in missed:
+                        self.socketio.emit("update_things", payload, namespace=self.namespace, to=sid)
+                    self.messages += len(missed)
+                    self.resumed += 1
+                    return
+            self.resume_fallbacks += 1
+        self.sync_to(aquarium, sid, tick, format)
+
+    def sync_to(self, aquarium, sid, tick, format="json"):
+        # A sync_everything for a single client that just connected (or changed format), instead of sending
+        # everything to everyone again. Everyone who connects during the same tick shares one snapshot.
+        # The snapshot has the Things as everyone else has them, with the same versions, so the update_things
+        # that follow work the same for the new client (see _snapshot_records)
+        start = time.perf_counter()
+        payload = self._sync_payload(aquarium, "snapshot", format)
+        self._record_encode_time(start, tick)
+        self._emit_sync(payload, to=sid)
+        self.updates += len(aquarium.objects)
+
+    def _sync_payload(self, aquarium, kind, format):
+        # This tick's "sync" (sync_everything) or "snapshot" (sync_to) in `format`, built once
+        # (aquarium.now only changes between ticks)
+        if (aquarium.now != self.sync_time) or not self.encode_once:
+            self.sync_time = aquarium.now
+            self.sync_payloads = {}
+        records = self.sync_payloads.get((kind, "records"))
+        if records is None:
+            records = self.sync_payloads[(kind, "records")] = self._sync_records(aquarium) if (kind == "sync") else self._snapshot_records(aquarium)
+        payload = self.sync_payloads.get((kind, format))
+        if payload is None:
+            if format == "packed":
+                try:
+                    payload = pack_things(records)
+                except ValueError as error:
+                    # Too many strings for the uint16 table, so this one goes out as JSON (unpackThings takes both)
+                    print(f"Sending a JSON {kind} to packed clients: {error}")
+                    payload = self._sync_payload(aquarium, kind, "json")
+            elif self.encode_once:
+                payload = EncodedJSON("[" + ",".join(map(self._encoded_record, records)) + "]")
+            else:
+                payload = records
+            self.sync_payloads[(kind, format)] = payload
+        return(payload)
+
+    def _sync_records(self, aquarium) -> list:
+        records = [self._full_record(thing.summarize) for thing in aquarium.objects.values()]
+        # Forget Things that left without us broadcasting it (in idle mode, say)
+        for cache in (self.sent, self.encoded):
+            for label in [label for label in cache if label not in aquarium.objects]:
+                del cache[label]
+        return(records)
+
+    def _snapshot_records(self, aquarium) -> list:
+        # Every Thing as everyone else has it: the summary we last broadcast and its version. Deltas are worked out
+        # against that, so anything newer here could be left out of the next one and stick around on the new
+        # client. Things nobody's been sent yet are as they are now (Thing.snapshot, which doesn't touch where
+        # their guess of each Thing's path starts), with version 0 so the full record they get first replaces it
+        if not self.delta_updates:
+            return([thing.snapshot() for thing in aquarium.objects.values()])
+        records = []
+        for thing in aquarium.objects.values():
+            entry = self.sent.get(thing.label)
+            if entry is None:
+                records.append({**thing.snapshot(), "version": 0})
+            else:
+                if entry[2] is None:
+                    entry[2] = {**entry[1], "version": entry[0]} # What _full_record would send for it
+                records.append(entry[2])
+        return(records)
+
+    def _encoded_record(self, record) -> str:
+        # The JSON for a sync_everything record (the same one as last time if the record hasn't changed)
+        label = record["label"]
+        encoded = self.encoded.get(label)
+        if (encoded is None) or (encoded[0] is not record):
+            encoded = self.encoded[label] = (record, encode_json(record))
+        return(encoded[1])
+
+    def _full_record(self, summary) -> dict:
+        # The whole summary (plus its version if we're sending deltas)
+        if not self.delta_updates:
+            return(summary)
+        entry = self.sent.get(summary["label"])
+        if entry is None:
+            entry = self.sent[summary["label"]] = [0, None, None]
+        if (summary is entry[1]) and (entry[2] is not None):
+            return(entry[2]) # A sleeping Thing's summary, nothing's changed
+        if summary != entry[1]:
+            entry[0] += 1
+            entry[1] = summary
+        entry[2] = {**summary, "version": entry[0]}
+        return(entry[2])
+
+    def _delta_record(self, summary) -> dict:
+        # Only what changed since the last time this Thing was broadcast (None if nothing did)
+        # The first time we see a Thing we send all of it
+        label = summary["label"]
+        entry = self.sent.get(label)
+        if summary.get("remove"):
+            self.sent.pop(label, None)
+            return({"label": label, "remove": True, "version": entry[0] + 1 if entry else 1})
+        if entry is None:
+            return(self._full_record(summary))
+        last_summary = entry[1]
+        changed = {key: value for key, value in summary.items() if (key not in last_summary) or (last_summary[key] != value)}
+        if not changed.keys() - {"update_time"}:
+            return(None)
+        entry[0] += 1
+        entry[1] = summary
+        entry[2] = None
+        changed["label"] = label
+        changed["version"] = entry[0]
+        return(changed)
+
+    def send_updates(self, updates, tick):
+        # The Things that changed during simulation tick number `tick`
+        if not updates:
+            return
+        if self.batch_updates:
+            start = time.perf_counter()
+            things = merge_updates(updates)
+            if self.delta_updates:
+                things = [record for record in map(self._delta_record, things) if record is not None]
+                if not things:
+                    return
+            payload = {"tick": tick, "things": things}
+            if self.sequenced:
+                self.seq += 1
+                payload["seq"] = self.seq
+                self.delta_fields += sum(map(len, things))
+            if self.encode_once:
+                payload = EncodedJSON(encode_json(payload))
+            if self.sequenced:
+                self.history.append((self.seq, payload))
+            self._record_encode_time(start, tick)
+            self.socketio.emit("update_things", payload, namespace=self.namespace)
+            self.messages += 1
+            self.updates += len(things)
+        else:
+            for update in updates:
+                self.socketio.emit("update_thing", update, namespace=self.namespace)
+            self.messages += len(updates)
+            self.updates += len(updates)
+
+    def _record_encode_time(self, start, tick):
+        # Every caller passes the simulation tick number (scheduler.steps), so a keyframe, the updates and the
+        # snapshots sent on the same tick add up to one tick
+        elapsed = time.perf_counter() - start
+        self.encode_time += elapsed
+        if tick != self.last_tick:
+            self.last_tick = tick
+            self.ticks += 1
+            self.tick_encode_time = 0.0
+        self.tick_encode_time += elapsed
+        self.worst_encode_time = max(self.worst_encode_time, self.tick_encode_time)
+
+    def report(self) -> str:
+        # Encode time per tick since the last report (for the logs)
+        ticks = self.ticks - self.ticks_at_last_report
+        encode_time = self.encode_time - self.encode_time_at_last_report
+        report = (f"{encode_time / max(1, ticks) * 1e3:.2f} ms encoding per tick over {ticks} ticks "
+                  f"(worst {self.worst_encode_time * 1e3:.2f} ms, {len(self.encoded)} Things encoded), "
+                  f"{self.keyframes} keyframes and {self.resumed} clients resumed so far ({self.resume_fallbacks} more needed a snapshot)")
+        self.ticks_at_last_report = self.ticks
+        self.encode_time_at_last_report = self.encode_time
+        self.worst_encode_time = 0.0
+        return(report)
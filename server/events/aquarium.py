@@ -1,12 +1,43 @@
+from flask import request
+from flask_socketio import emit, join_room, leave_room
 from server.helper import settings, authenticated_only
+from server.broadcast import PACKED_SYNC, PACKED_SCHEMA
 from server.models.aquarium import Fish
 
 def register_events(socketio, command_queue):
     @socketio.on("connect", namespace="/aquarium")
-    def connect():
-        # Send the current state of the aquarium to the new client (all clients)
-        command_queue.put(("sync", None))
+    def connect(auth=None):
+        # The simulation sends the new client (only them) what it missed, or the current state of the aquarium
+        # Reconnecting clients tell us where they were in the stream (and new ones the format they want) in `auth`
+        # The simulation also counts viewers so it can idle when nobody is watching
+        auth = auth if isinstance(auth, dict) else {}
+        format = join_format(auth.get("format"))
+        position = {"stream": auth.get("stream"), "seq": auth.get("seq")} if (auth.get("seq") is not None) else None
+        command_queue.put(("viewer_connected", {"sid": request.sid, "format": format, "position": position}))
 
     @socketio.on("disconnect", namespace="/aquarium")
     def disconnect():
-        pass
\ No newline at end of file
+        command_queue.put(("viewer_disconnected", {"sid": request.sid}))
+
+    @socketio.on("resume", namespace="/aquarium")
+    def resume(data):
+        # A client missed some update_things (check `docs/socketio.md`)
+        command_queue.put(("viewer_resume", {"sid": request.sid, "position": {"stream": data.get("stream"), "seq": data.get("seq")}}))
+
+    @socketio.on("sync_format", namespace="/aquarium")
+    def sync_format(data):
+        # Clients can ask for sync_everything in the binary format (check `docs/socketio.md`)
+        if (data.get("format") != "packed") or not PACKED_SYNC:
+            return
+        leave_room("json")
+        join_format("packed")
+        command_queue.put(("viewer_format", {"sid": request.sid, "format": "packed"}))
+
+    def join_format(format):
+        # Put the client in the room for their sync_everything format (everyone gets JSON unless they ask)
+        if (format == "packed") and PACKED_SYNC:
+            join_room("packed")
+            emit("sync_schema", PACKED_SCHEMA) # Before any packed sync (they go out from the simulation loop)
+            return("packed")
+        join_room("json")
+        return("json")
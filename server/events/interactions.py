@@ -1,16 +1,98 @@
-from flask import copy_current_request_context
+from flask import copy_current_request_context, request
 from flask_login import current_user
+from flask_socketio import disconnect as disconnect_client
 from server.helper import settings, tool_types, authenticated_only, confirm_user
+import time
+
+# Cursors are the busiest thing clients send (every mouse move), so instead of rebroadcasting each one
+# we keep the latest position of every user and send all the ones that moved in one message a few times a second
+CURSOR_BATCHING = True # Send cursors in batches (the cursors event) instead of rebroadcasting every cursor event
+CURSOR_FLUSH_FREQUENCY = 15 # batches per second
+CURSOR_MAX_RATE = 120 # cursor events per second we accept from each user (the rest are dropped, mice send about 60)
+CURSOR_BURST = 20 # cursor events a user can send at once before CURSOR_MAX_RATE kicks in
+CURSOR_REPORT_FREQUENCY = 300 # seconds between cursor stats in the logs
+
+class CursorAggregator():
+    def __init__(self, socketio, namespace="/interactions", flush_frequency=CURSOR_FLUSH_FREQUENCY,
+                 max_rate=CURSOR_MAX_RATE, burst=CURSOR_BURST):
+        self.socketio = socketio
+        self.namespace = namespace
+        self.flush_frequency = flush_frequency
+        self.max_rate = max_rate
+        self.burst = burst
+        self.pending = {} # {username: latest cursor event} since the last flush
+        self.allowance = {} # {username: [events they can still send, time we last checked]} (a token bucket)
+
+        # Stats
+        self.received = 0 # cursor events we got
+        self.merged = 0 # events replaced by a newer one from the same user before we sent them
+        self.dropped = 0 # events over a user's rate limit
+        self.flushes = 0 # cursors messages sent
+        self.sent = 0 # cursors sent (in those messages)
+        self.last_report = time.monotonic()
+
+    def add(self, data, now=None) -> bool:
+        # Queue a cursor event for the next flush (False if the user is over their rate limit)
+        now = time.monotonic() if (now is None) else now
+        self.received += 1
+        username = data["username"]
+        allowance = self.allowance.get(username)
+        if allowance is None:
+            allowance = self.allowance[username] = [self.burst, now]
+        allowance[0] = min(self.burst, allowance[0] + (now - allowance[1]) * self.max_rate)
+        allowance[1] = now
+        if allowance[0] < 1:
+            self.dropped += 1
+            return(False)
+        allowance[0] -= 1
+        if username in self.pending:
+            self.merged += 1
+        self.pending[username] = data
+        return(True)
+
+    def remove(self, username):
+        # Forget a user that left (their last cursor still goes out if it's pending)
+        self.allowance.pop(username, None)
+
+    def flush(self):
+        # Send every cursor that moved since the last flush in one message
+        if not self.pending:
+            return
+        cursors, self.pending = list(self.pending.values()), {}
+        self.socketio.emit("cursors", {"cursors": cursors}, namespace=self.namespace)
+        self.flushes += 1
+        self.sent += len(cursors)
+
+    def report(self) -> str:
+        return(f"{self.received} received, {self.sent} sent in {self.flushes} batches, "
+               f"{self.merged} merged, {self.dropped} dropped over the rate limit")
+
+    def run(self):
+        # Background task: flush every 1 / flush_frequency seconds (and report now and then)
+        while True:
+            self.socketio.sleep(1 / self.flush_frequency)
+            self.flush()
+            now = time.monotonic()
+            if (now - self.last_report) > CURSOR_REPORT_FREQUENCY:
+                self.last_report = now
+                if self.received:
+                    print(f"Cursors: {self.report()}")
 
 def register_events(socketio, command_queue):
+    cursors = CursorAggregator(socketio)
+    if CURSOR_BATCHING:
+        socketio.start_background_task(cursors.run)
+    usernames = {} # {sid: username} checked once when the client connects (instead of on every cursor event)
 
     @socketio.on("connect", namespace="/interactions")
     def connect():
-        pass
+        usernames[request.sid] = current_user.username
 
     @socketio.on("disconnect", namespace="/interactions")
     def disconnect():
-        pass
+        username = usernames.pop(request.sid, None)
+        if username not in usernames.values():
+            cursors.remove(username)
 
     @socketio.on("tap", namespace="/interactions")
     @confirm_user
@@ -50,6 +132,13 @@ def register_events(socketio, command_queue):
         socketio.emit("select", data, namespace="/interactions")
 
     @socketio.on("cursor", namespace="/interactions")
-    @confirm_user
     def cursor(data):
-        socketio.emit("cursor", data, namespace="/interactions")
+        # Same check as confirm_user, against the username we saw when they connected
+        if data["username"] != usernames.get(request.sid):
+            print(f"User {usernames.get(request.sid)} tried to move the cursor of {data['username']}")
+            disconnect_client()
+            return
+        if CURSOR_BATCHING:
+            cursors.add(data)
+        else:
+            socketio.emit("cursor", data, namespace="/interactions")
@@ -1,5 +1,38 @@
 from server.helper import settings, save_to_s3
-import random, math, uuid, datetime, os, pickle
+from server.models.spatial import SpatialHash
+from server.models.physics import PhysicsEngine, install_fields, MOVEMENT_FIELDS, METABOLISM_FIELDS
+from server.models.pool import EntityPool
+from server.models.timers import TimerQueue
+import random, math, datetime, time, os, pickle, ast, heapq, operator
+
+# Class buckets at most this big are scanned directly instead of going through the spatial index
+SMALL_CLASS_BUCKET = 64
+
+# Class names are interned as bits so checking a class hierarchy is a single AND (instead of list lookups)
+# These bits are only valid for this process -- don't pickle them!
+class_bits = {} # {class_name: bit}
+_class_masks = {} # {tuple(class_hierarchy): mask}
+
+def class_mask(class_hierarchy) -> int:
+    key = tuple(class_hierarchy)
+    mask = _class_masks.get(key)
+    if mask is None:
+        mask = 0
+        for class_name in key:
+            if class_name not in class_bits:
+                class_bits[class_name] = 1 << len(class_bits)
+            mask |= class_bits[class_name]
+        _class_masks[key] = mask
+    return(mask)
+
+def new_generation() -> int:
+    # The start time (seconds) and 16 random bits, so every start gets its own generation of labels
+    # Counting up from the last snapshot wouldn't do: new aquariums all start at the same one, and labels
+    # handed out after the last save would be handed out again after a crash
+    return((int(time.time()) << 16) | random.getrandbits(16))
+
+# Adding one of these makes the fish nearby decide again (see Aquarium.add_object)
+DECISION_EVENT_MASK = class_mask(["Food"]) | class_mask(["Tap"]) | class_mask(["Fish"])
 
 class Aquarium():
     def __init__(self, command_queue, user_manager, width=960, height=540):
@@ -7,8 +40,33 @@ class Aquarium():
         self.height = height
         self.objects = {}
         self.command_queue = command_queue
+
+        # Index objects by position so neighbor queries don't have to scan everything
+        self.spatial_index = SpatialHash()
+        # And by class, so "all Taps" only looks at Taps
+        self.objects_by_class = {} # {class_name: {label: object}}
+        # Objects that need update() every tick (the rest are asleep, see Thing.sleep)
+        self.awake = {} # {label: object}
+
+        # Setting this also subscribes us to users coming online/going offline (see the property below)
         self.user_manager = user_manager
 
+        # Optional vectorized movement/metabolism (see enable_physics_engine)
+        self.physics = None
+
+        # Removed short-lived Things waiting to be reused (see server/models/pool.py)
+        self.pool = EntityPool()
+
+        # Labels are "<generation>-<id>" in hex. Every start gets a new generation (see new_generation), so
+        # new labels never clash with ones handed out before a restart (even if that was never saved)
+        self.generation = new_generation()
+        self.next_id = 0
+
+        # The clock, read once per tick (ms since epoch) -- use this instead of calling datetime.now()
+        self.now = time.time() * 1000
+        # Deadlines Things have registered (lifetimes, chest cycles, etc.), see server/models/timers.py
+        self.timers = TimerQueue()
+
         # Keep track of updated objects for broadcasting
         self.broadcast_updates = [] # Moved from the simluate.py loop :)
         
@@ -17,41 +75,297 @@ class Aquarium():
             "width", "height"
         ]
 
+    @property
+    def user_manager(self):
+        return(self._user_manager)
+
+    @user_manager.setter
+    def user_manager(self, user_manager):
+        old_user_manager = getattr(self, "_user_manager", None)
+        if old_user_manager is not None:
+            old_user_manager.remove_listener(self)
+        self._user_manager = user_manager
+        if user_manager is not None:
+            user_manager.add_listener(self)
+        # Who's online might have changed while we were detached, so start the fish's tallies over
+        for fish in self.objects_by_class.get("Fish", {}).values():
+            fish._recount_online_relationships()
+
+    def user_came_online(self, username):
+        # Called by the UserManager (we're one of its listeners)
+        for fish in self.objects_by_class.get("Fish", {}).values():
+            fish._user_came_online(username)
+
+    def user_went_offline(self, username):
+        for fish in self.objects_by_class.get("Fish", {}).values():
+            fish._user_went_offline(username)
+
     def create_object(self, class_name, kwargs={}, properties={}):
-        # Use this when creating new objects where the class isn't imported yet
-        # Do this through the command queue and maintain the simulate.py as the main namespace?
+        # Use this when creating new objects from inside the simulation (e.g. a Fish dropping a Coin)
+        # It goes through the command queue, and simulate.py builds it with new_object() on the next loop
         self.command_queue.put(("create", {
             "object_name": class_name, 
             "object_kwargs": kwargs, 
             "object_properties" : properties
         }))
 
+    def new_object(self, class_name, kwargs={}, properties={}):
+        # Build (but don't add) a Thing from its class name using the thing_classes registry
+        thing_class = thing_classes.get(class_name)
+        if thing_class is None:
+            print(f"Can't create unknown class {class_name}")
+            return(None)
+        new_object = self.pool.new(thing_class, self, kwargs)
+        for key, value in properties.items():
+            setattr(new_object, key, value)
+        return(new_object)
+
+    def new_label(self) -> str:
+        self.next_id += 1
+        return(f"{self.generation:x}-{self.next_id:x}")
+
+    def _index_object(self, object):
+        object._class_mask = class_mask(object.class_hierarchy)
+        for class_name in object.class_hierarchy:
+            self.objects_by_class.setdefault(class_name, {})[object.label] = object
+        self.spatial_index.insert(object)
+
+    def _unindex_object(self, object):
+        for class_name in object.class_hierarchy:
+            self.objects_by_class.get(class_name, {}).pop(object.label, None)
+        self.spatial_index.remove(object)
+
     def add_object(self, object):
         self.objects[object.label] = object
+        self.awake[object.label] = object # Everything starts awake
+        self._index_object(object)
+        if self.physics is not None:
+            self.physics.add(object)
+        object._schedule_timers()
+        # New food, taps and fish might change what the fish nearby want to do (bubbles, coins etc. don't)
+        if object._class_mask & DECISION_EVENT_MASK:
+            self.alert_fish_near(object)
         self.broadcast_updates.append(object.summarize)
         # This method more easily allows us to add add objects from children.
 
     def remove_object(self, object):
         self.objects.pop(object.label)
+        self.awake.pop(object.label, None)
+        self._unindex_object(object)
+        if self.physics is not None:
+            self.physics.remove(object) # Before summarizing, so the object has its final position
         # We should think about how to broadcast this change...
-        object_summarize = object.summarize
-        object_summarize["remove"] = True
-        self.broadcast_updates.append(object_summarize)
+        # (a copy, summaries of sleeping Things are shared)
+        self.broadcast_updates.append({**object.summarize, "remove": True})
+        self.pool.release(object)
 
     def update(self, delta_time):
-        # Nothing to do here yet...
-        pass
+        self.now = time.time() * 1000
+        # Things removed last tick can be reused from now on
+        self.pool.recycle()
+        # Only the Things whose deadlines have arrived do any work here
+        self.timers.run_due(self.now, self.objects)
+        # Move everything (and feed/age the fish) in one batch if the physics engine is on
+        # Things skip their own movement and metabolism when they're attached to the engine
+        if self.physics is not None:
+            self.physics.step(delta_time)
+
+    def fast_forward(self, seconds):
+        # Advance the aquarium by `seconds` in one step instead of ticking through it (nobody's watching)
+        # Things jump along their paths, Fish advance their metabolism exactly, and every timer that came
+        # due in the meantime (lifetimes, chest cycles) runs once at the end
+        self.now += seconds * 1000
+        self.pool.recycle()
+        for thing in list(self.awake.values()): # Sleeping Things are at rest, so there's nothing to skip
+            if thing.label in self.objects: # Might have been removed by another Thing
+                thing.fast_forward(seconds)
+        self.timers.run_due(self.now, self.objects)
+
+    def catch_up(self, limit=None):
+        # Call after loading a snapshot (before the first tick) to skip over the time we were down
+        # We fast-forward up to `limit` seconds of it and shift every timestamp past the rest, as if it never happened
+        start = time.perf_counter()
+        downtime = max(0, time.time() * 1000 - self.now) / 1000
+        skipped = max(0, downtime - limit) if (limit is not None) else 0
+        if skipped > 0:
+            for object in self.objects.values():
+                object._rebase(skipped * 1000)
+            self.now += skipped * 1000
+            self.timers.clear()
+            for object in self.objects.values():
+                object._schedule_timers()
+        objects_before = len(self.objects)
+        self.fast_forward(downtime - skipped) # Anything that expired in the meantime goes in one sweep
+        self.broadcast_updates = [] # Nobody's connected yet (clients get a sync_everything when they connect)
+        print(f"Caught up on {downtime:.0f}s of downtime ({downtime - skipped:.0f}s fast-forwarded, {skipped:.0f}s skipped, "
+              f"{objects_before - len(self.objects)} objects expired) in {time.perf_counter() - start:.3f}s")
+
+    def enable_physics_engine(self):
+        # Keep positions, destinations, speeds, hunger and health in NumPy arrays (server/models/physics.py)
+        install_fields(Thing, MOVEMENT_FIELDS)
+        install_fields(Fish, METABOLISM_FIELDS)
+        if self.physics is None:
+            self.physics = PhysicsEngine(self)
+            for object in self.objects.values():
+                self.physics.add(object)
+
+    def disable_physics_engine(self):
+        if self.physics is not None:
+            self.physics.detach_all()
+            self.physics = None
+
+    @property
+    def activity(self) -> str:
+        return(f"{len(self.awake)} of {len(self.objects)} objects awake")
+
+    def object_moved(self, object):
+        # Things call this after they change position so the spatial index stays up to date
+        # (fish don't alert each other as they swim, every fish looks for predators when it decides, see Fish.update)
+        self.spatial_index.move(object)
+
+    def alert_fish_near(self, object):
+        # Make the fish around `object` rethink what they're doing on their next update (see Fish.update)
+        if not self.objects_by_class.get("Fish"):
+            return
+        for fish, distance in self.find_within(object.x, object.y, Fish.decision_event_radius, class_hierarchy=["Thing", "Fish"], exclude=object.label):
+            fish._reconsider()
+
+    def _class_candidates(self, class_hierarchy) -> dict:
+        # The smallest class bucket that every match has to be in (e.g. "Pellet" for ["Thing", "Food", "Pellet"])
+        smallest = None
+        for class_name in class_hierarchy:
+            bucket = self.objects_by_class.get(class_name)
+            if not bucket:
+                return({}) # Nothing of this class in the aquarium at all
+            if (smallest is None) or (len(bucket) < len(smallest)):
+                smallest = bucket
+        return(smallest if smallest is not None else self.objects)
+
+    def find_nearest(self, x, y, class_hierarchy=["Thing"], exclude=None) -> tuple:
+        # Closest object of a certain class to (x, y) -- returns (object, distance)
+        mask = class_mask(class_hierarchy)
+        candidates = self._class_candidates(class_hierarchy)
+        if len(candidates) > SMALL_CLASS_BUCKET:
+            return(self.spatial_index.nearest(x, y, predicate=_mask_predicate(mask), exclude=exclude))
+        closest = None
+        closest_distance = float("inf")
+        for label, obj in candidates.items():
+            if (label == exclude) or (obj._class_mask & mask != mask):
+                continue
+            distance = math.sqrt((x - obj.x)**2 + (y - obj.y)**2)
+            if distance < closest_distance:
+                closest = obj
+                closest_distance = distance
+        return(closest, closest_distance)
+
+    def find_nearest_each(self, x, y, class_hierarchies, exclude=None) -> list:
+        # Closest object for each of several class hierarchies, in a single pass over the candidates
+        # Returns a list of (object, distance) tuples in the same order as class_hierarchies
+        closest = [(None, float("inf")) for _ in class_hierarchies]
+        masks = [class_mask(class_hierarchy) for class_hierarchy in class_hierarchies]
+        buckets = {} # {id(bucket): bucket} so overlapping hierarchies don't scan a bucket twice
+        for class_hierarchy in class_hierarchies:
+            bucket = self._class_candidates(class_hierarchy)
+            if bucket:
+                buckets[id(bucket)] = bucket
+        if any(len(bucket) > SMALL_CLASS_BUCKET for bucket in buckets.values()):
+            # Hierarchies with no candidates at all would make the grid search look everywhere, so skip them
+            searchable = [i for i, class_hierarchy in enumerate(class_hierarchies) if self._class_candidates(class_hierarchy)]
+            found = self.spatial_index.nearest_each(x, y, [_mask_predicate(masks[i]) for i in searchable], exclude=exclude)
+            for i, result in zip(searchable, found):
+                closest[i] = result
+            return(closest)
+        for bucket in buckets.values():
+            for label, obj in bucket.items():
+                if label == exclude:
+                    continue
+                distance = None
+                for i, mask in enumerate(masks):
+                    if obj._class_mask & mask != mask:
+                        continue
+                    if distance is None:
+                        distance = math.sqrt((x - obj.x)**2 + (y - obj.y)**2)
+                    if distance < closest[i][1]:
+                        closest[i] = (obj, distance)
+        return(closest)
+
+    def find_within(self, x, y, radius, class_hierarchy=["Thing"], exclude=None) -> list:
+        # All objects of a certain class within radius of (x, y) -- returns a list of (object, distance)
+        mask = class_mask(class_hierarchy)
+        candidates = self._class_candidates(class_hierarchy)
+        if len(candidates) > SMALL_CLASS_BUCKET:
+            return(self.spatial_index.query_radius(x, y, radius, predicate=_mask_predicate(mask), exclude=exclude))
+        results = []
+        for label, obj in candidates.items():
+            if (label == exclude) or (obj._class_mask & mask != mask):
+                continue
+            distance = math.sqrt((x - obj.x)**2 + (y - obj.y)**2)
+            if distance <= radius:
+                results.append((obj, distance))
+        return(results)
+
+    def find_colliding(self, object, class_hierarchy=["Thing"]) -> list:
+        # All objects of a certain class whose bounding boxes overlap with this object's
+        mask = class_mask(class_hierarchy)
+        candidates = self._class_candidates(class_hierarchy)
+        if len(candidates) > SMALL_CLASS_BUCKET:
+            return(self.spatial_index.query_rect(object.x, object.y, object.width, object.height,
+                                                 predicate=_mask_predicate(mask), exclude=object.label))
+        return([obj for label, obj in candidates.items()
+                if (label != object.label) and (obj._class_mask & mask == mask) and object._is_colliding(obj)])
 
     @property
     def summarize(self):
         return_dict = {
-            "update_time": datetime.datetime.now().timestamp() * 1000,
+            "update_time": self.now,
             "objects": [label for label in self.objects.keys()]
         }
         for prop in self.properties_to_broadcast:
             return_dict[prop] = getattr(self, prop)
         return(return_dict)
 
+    def __getstate__(self):
+        # Don't pickle the indexes -- they're rebuilt from the objects when loading
+        state = self.__dict__.copy()
+        state.pop("spatial_index", None)
+        state.pop("objects_by_class", None)
+        state.pop("awake", None)
+        state.pop("physics", None) # Things copy their values out of the engine when they're pickled
+        state.pop("pool", None)
+        state.pop("timers", None) # Holds references to the objects, so it's rebuilt from them instead
+        state.pop("_user_manager", None) # Always reattached after loading
+        return(state)
+
+    def __setstate__(self, state):
+        state.pop("user_manager", None) # Older snapshots
+        self.__dict__.update(state)
+        self._user_manager = None
+        self.physics = None # Turn it back on with enable_physics_engine()
+        self.pool = EntityPool()
+        # New generation of labels (older snapshots used uuid4 labels, which can't clash with these)
+        self.generation = new_generation()
+        self.next_id = 0
+        # Keep the clock where it was saved so catch_up knows how long we were down
+        # Older snapshots didn't save it, but it can't be earlier than the newest thing that happened in there
+        # (wall time would make the downtime 0, and everything that expired while we were down would expire
+        # over the first few ticks instead of in catch_up)
+        if "now" not in state:
+            self.now = max((object._latest_timestamp() for object in self.objects.values()), default=time.time() * 1000)
+        # Older snapshots won't have the indexes either, so always rebuild them
+        self.spatial_index = SpatialHash()
+        self.objects_by_class = {}
+        for object in self.objects.values():
+            self._index_object(object)
+        # Wake everything up, things at rest go back to sleep on their first update
+        self.awake = dict(self.objects)
+        # Same for the timers (anything that came due while we were down fires in catch_up)
+        self.timers = TimerQueue()
+        for object in self.objects.values():
+            object._schedule_timers()
+        # Nobody is online until the user manager is reattached
+        for fish in self.objects_by_class.get("Fish", {}).values():
+            fish._recount_online_relationships()
+
     def save(self, save_dir=settings.S3_AQUARIUM_SAVE_DIR):
         filename = f"{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}_aquarium.pkl"
         # WE HAVE TO DETACH THE COMMAND QUEUE AND USERMANAGER BEFORE PICKLING!!!
@@ -67,15 +381,63 @@ class Aquarium():
         self.command_queue = command_queue
         self.user_manager = user_manager
 
+def _mask_predicate(mask):
+    # Objects that match the class hierarchy (this doesn't respect order of the list, but it shouldn't matter)
+    return(lambda obj: obj._class_mask & mask == mask)
+
+# Every Thing class by name (e.g. thing_classes["Coin"]), filled in automatically as classes are defined
+# This is how we create objects from a class name (Aquarium.create_object and the command queue)
+thing_classes = {}
+
 class Thing():
+    # Attributes every Thing has (slots, so the small short-lived Things don't each need a __dict__)
+    # Subclasses that don't define __slots__ (like Fish) still get a normal __dict__ for everything else
+    __slots__ = (
+        "aquarium", "label", "width", "_height", "x", "y", "speed", "destination_x", "destination_y",
+        "time_created", "lifetime", "_expires_at", "animation_prefix", "updated_this_loop", "_physics_slot", "_class_mask",
+        "_trajectory", "_summary",
+    )
+    pooled = False # Reuse removed objects of this class (see server/models/pool.py)
+    states = () # States with a _<state> method, for the state dispatch table (see Fish.update)
+    # Clients move Things along a straight line toward their destination between updates (interpolatePosition
+    # in gameModels.js), so we only need to broadcast when that guess is off (see should_broadcast)
+    trajectory_tolerance = 10 # Pixels the client's guess can be off from where we really are
+    destination_tolerance = 50 # Pixels our destination can move before we tell the clients
+
+    # Per-class constants (shared by every instance instead of being copied into each one)
+    # class_hierarchy is filled in automatically for subclasses, e.g. ["Thing", "Food", "Flake"]
+    class_hierarchy = ["Thing"]
+    aspect_ratio = None # aspect_ratio = width / height
+    spritesheet_json = None
+    default_texture = None
+    default_animation = None
+    properties_to_broadcast = [
+        "label", "class_hierarchy", "x", "y", "speed", "destination_x", "destination_y", "aspect_ratio",
+        "width", "height", "time_created", "spritesheet_json", "default_texture", "default_animation", "animation_prefix"
+    ]
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        thing_classes[cls.__name__] = cls
+        # The class hierarchy is just the chain of Thing classes (unless a class sets its own)
+        if "class_hierarchy" not in cls.__dict__:
+            cls.class_hierarchy = [*cls.__mro__[1].class_hierarchy, cls.__name__]
+        # Each class gets its own {state: method} table (so overriding a state method in a subclass works)
+        cls._state_handlers = {state: getattr(cls, f"_{state}") for state in cls.states if callable(getattr(cls, f"_{state}", None))}
+        # Every slot name in the class's MRO (for pickling)
+        cls._slot_names = [name for klass in cls.__mro__ for name in klass.__dict__.get("__slots__", ())
+                           if name not in ("__dict__", "__weakref__")]
+        # Reads every property in properties_to_broadcast in one call (see summarize)
+        cls._summary_getter = operator.attrgetter(*cls.properties_to_broadcast)
+
     def __init__(self, aquarium):
         self.aquarium = aquarium
-        self.label = str(uuid.uuid4())
+        self.label = aquarium.new_label()
+        self._physics_slot = None # Slot in aquarium.physics (None when not attached)
 
         # Size properties
-        self.aspect_ratio = None # aspect_ratio = width / height
         self.width = 0
-        self._height = 0
+        self._height = 0 # Only used if aspect_ratio is None
 
         # Position and movement properties
         self.x = 0
@@ -85,22 +447,17 @@ class Thing():
         self.destination_y = 0
 
         # Lifetime properties and housekeeping
-        self.time_created = datetime.datetime.now().timestamp() * 1000
+        self.time_created = aquarium.now # ms since epoch
         self.lifetime = None # Seconds, None for infinite
+        self._expires_at = None # ms since epoch (time_created + lifetime)
 
-        # Texture/animation properties
-        self.spritesheet_json = None
-        self.default_texture = None
-        self.default_animation = None
+        # Texture/animation properties (the rest are per-class constants above)
         self.animation_prefix = "" # For spritesheets with multiple animations
 
         # Houskeeping properties
-        self.class_hierarchy = ["Thing"]
         self.updated_this_loop = False
-        self.properties_to_broadcast = [
-            "label", "class_hierarchy", "x", "y", "speed", "destination_x", "destination_y", "aspect_ratio",
-            "width", "height", "time_created", "spritesheet_json", "default_texture", "default_animation", "animation_prefix"
-        ]
+        self._trajectory = None # What the clients last saw (x, y, destination_x, destination_y, speed, state, time)
+        self._summary = None # Our last summary while we're asleep (see summarize)
 
     @property
     def height(self):
@@ -114,9 +471,70 @@ class Thing():
         # Will be called by the simulation loop. Return a list of changes to broadcast to the front-end
         self._move_toward_destination(delta_time)
 
+    def fast_forward(self, seconds):
+        # Skip ahead `seconds` in one step (see Aquarium.fast_forward)
+        # Things move in a straight line at a constant speed, so jump to where we'd be and let update() react
+        self._jump_toward_destination(seconds)
+        self.update(0)
+
     def remove(self):
         self.aquarium.remove_object(self)
 
+    def should_broadcast(self) -> bool:
+        # Called after update(), True if the clients need to hear about us this tick
+        return(self.updated_this_loop or self._off_trajectory())
+
+    def _off_trajectory(self) -> bool:
+        # Would the clients' guess of where we are (from the last summary they got) be wrong by now?
+        if self._trajectory is None:
+            return(True)
+        x, y, destination_x, destination_y, speed, state, time_sent = self._trajectory
+        if (speed != self.speed) or (state != getattr(self, "state", None)):
+            return(True)
+        if (abs(destination_x - self.destination_x) > self.destination_tolerance) or (abs(destination_y - self.destination_y) > self.destination_tolerance):
+            return(True)
+        # Same math as interpolatePosition in gameModels.js
+        distance = math.sqrt((destination_x - x)**2 + (destination_y - y)**2)
+        travelled = speed * (self.aquarium.now - time_sent) / 1000
+        if (distance == 0) or (travelled >= distance):
+            predicted_x, predicted_y = destination_x, destination_y
+        else:
+            predicted_x = x + (destination_x - x) * travelled / distance
+            predicted_y = y + (destination_y - y) * travelled / distance
+        return(math.sqrt((predicted_x - self.x)**2 + (predicted_y - self.y)**2) > self.trajectory_tolerance)
+
+    def _rebase(self, shift):
+        # Move our timestamps `shift` ms later (see Aquarium.catch_up), child classes add their own
+        self.time_created += shift
+        self.mark_dirty()
+
+    def _latest_timestamp(self):
+        # Our newest saved timestamp (ms since epoch), for snapshots that didn't save the aquarium's clock
+        # Child classes with their own timestamps add them (see Aquarium.__setstate__)
+        return(self.time_created)
+
+    def sleep(self):
+        # Stop getting update() calls until something wakes us up (a click or a new destination)
+        # Timers still fire while we're asleep, so sleep if the only thing left to do is on a timer
+        self.aquarium.awake.pop(self.label, None)
+
+    def wake(self):
+        if self.label in self.aquarium.objects:
+            self.aquarium.awake[self.label] = self
+            self.mark_dirty()
+
+    def mark_dirty(self):
+        # Call after changing a sleeping Thing from outside of update() (a timer, say) so it gets summarized again
+        # Awake Things are summarized from scratch every time anyway
+        self._summary = None
+
+    def _at_rest(self) -> bool:
+        return((self.speed == 0) or ((self.x == self.destination_x) and (self.y == self.destination_y)))
+
+    def _sleep_if_at_rest(self):
+        if self._at_rest():
+            self.sleep()
+
     def click(self):
         # Placeholder for child classes to override
         # Will be called by in the command queue when a user clicks on the object
@@ -147,13 +565,15 @@ class Thing():
         self.speed = speed if speed is not None else self.max_speed
         self.destination_x = self._limit_x_coordinate(self.destination_x)
         self.destination_y = self._limit_y_coordinate(self.destination_y)
-        self.updated_this_loop = True
+        self.wake()
 
     def _move_toward_destination(self, delta_time):
+        if self._physics_slot is not None:
+            return # The physics engine already moved us this tick
         # Could be optimized by only calculating the direction once (but that's another property to keep track of)
         direction = math.atan2(self.destination_y - self.y, self.destination_x - self.x)
-        new_x = self.speed * math.cos(direction) * delta_time.total_seconds() + self.x
-        new_y = self.speed * math.sin(direction) * delta_time.total_seconds() + self.y
+        new_x = self.speed * math.cos(direction) * delta_time + self.x
+        new_y = self.speed * math.sin(direction) * delta_time + self.y
         new_x = self._limit_x_coordinate(new_x)
         new_y = self._limit_y_coordinate(new_y)
         # Make sure we haven't overshot the destination 
@@ -163,11 +583,56 @@ class Thing():
             new_y = self.destination_y
         self.x = self._limit_x_coordinate(new_x)
         self.y = self._limit_y_coordinate(new_y)
+        self.aquarium.object_moved(self)
+
+    def _jump_toward_destination(self, seconds):
+        # Same as _move_toward_destination but for any length of time (and even with the physics engine on)
+        distance = math.sqrt((self.destination_x - self.x)**2 + (self.destination_y - self.y)**2)
+        travel = self.speed * seconds
+        if travel >= distance:
+            new_x, new_y = self.destination_x, self.destination_y
+        else:
+            new_x = self.x + (self.destination_x - self.x) * travel / distance
+            new_y = self.y + (self.destination_y - self.y) * travel / distance
+        self.x = self._limit_x_coordinate(new_x)
+        self.y = self._limit_y_coordinate(new_y)
+        self.aquarium.object_moved(self)
+
+    def __getstate__(self):
+        # Slots and __dict__ together as one flat dictionary
+        # (getattr also copies our current values out of the physics engine, which isn't pickled)
+        names = list(type(self)._slot_names) + list(getattr(self, "__dict__", {}).keys())
+        state = {name: getattr(self, name) for name in names if hasattr(self, name)}
+        state["_physics_slot"] = None
+        state.pop("_class_mask", None) # Only valid for this process, rebuilt when the aquarium loads
+        state.pop("_trajectory", None) # Clients will get everything again anyway
+        state.pop("_summary", None)
+        return(state)
+
+    def __setstate__(self, state):
+        self._physics_slot = None
+        self._trajectory = None
+        self._summary = None
+        for key, value in state.items():
+            if (key in CLASS_CONSTANTS) or (key == "_physics_slot"):
+                continue # Older snapshots stored these per instance
+            setattr(self, key, value) # Through setters, so older snapshots get converted (e.g. food_preferences)
+
+    def _schedule_timers(self):
+        # Register our deadlines with the aquarium (called by add_object, and again after loading a snapshot)
+        # Child classes with their own timers should extend this
+        self._schedule_lifetime()
 
-    def _calculate_lifetime(self):
+    def _schedule_lifetime(self):
+        # Call this again whenever lifetime changes
         if self.lifetime is None:
+            self._expires_at = None
             return
-        if (datetime.datetime.now().timestamp() * 1000 - self.time_created) > self.lifetime * 1000:
+        self._expires_at = self.time_created + self.lifetime * 1000
+        self.aquarium.timers.schedule(self._expires_at, self, "_expire")
+
+    def _expire(self, when):
+        if when == self._expires_at: # Otherwise our lifetime changed after this was scheduled
             self.remove()
 
     def _is_colliding(self, other):
@@ -184,45 +649,145 @@ class Thing():
         return(x, y)
         
     def _find_closest(self, class_hierarchy=["Thing"]) -> tuple:
-        # Find the closest object of a certain class
-        closest = None
-        closest_distance = float("inf")
-        for obj in self.aquarium.objects.values():
-            if obj.label == self.label:
-                continue # Skip self
-            if not all([c in obj.class_hierarchy for c in class_hierarchy]):
-                # Skip objects that don't match the class hierarchy
-                # This doesn't respect order of the list, but it shouldn't matter
-                continue 
-            distance = math.sqrt((self.x - obj.x)**2 + (self.y - obj.y)**2)
-            if distance < closest_distance:
-                closest = obj
-                closest_distance = distance
-        return(closest, closest_distance)
+        # Find the closest object of a certain class (through the aquarium's spatial index)
+        return(self.aquarium.find_nearest(self.x, self.y, class_hierarchy=class_hierarchy, exclude=self.label))
+
+    def _find_within(self, radius, class_hierarchy=["Thing"]) -> list:
+        # Find all objects of a certain class within radius pixels -- list of (object, distance)
+        return(self.aquarium.find_within(self.x, self.y, radius, class_hierarchy=class_hierarchy, exclude=self.label))
+
+    def _find_colliding(self, class_hierarchy=["Thing"]) -> list:
+        # Find all objects of a certain class that this object is colliding with
+        return(self.aquarium.find_colliding(self, class_hierarchy=class_hierarchy))
+
+    def snapshot(self) -> dict:
+        # Our summary, without changing where the clients' guess of our path starts (for a client that's joining
+        # while everyone else carries on from the last summary they got, see Broadcaster.sync_to)
+        # Don't change the dictionary you get back, it's shared while we're asleep (nothing about us changes
+        # until something wakes us up or calls mark_dirty, so we reuse the same summary until then)
+        return_dict = self._summary
+        if return_dict is None:
+            return_dict = {"update_time": self.aquarium.now}
+            return_dict.update(zip(self.properties_to_broadcast, self._summary_getter(self)))
+            if (self.label in self.aquarium.objects) and (self.label not in self.aquarium.awake):
+                self._summary = return_dict
+        return(return_dict)
 
     @property
     def summarize(self):
-        return_dict = {
-            "update_time": datetime.datetime.now().timestamp() * 1000
-        }
-        for prop in self.properties_to_broadcast:
-            return_dict[prop] = getattr(self, prop)
+        return_dict = self.snapshot()
+        # Summaries are what we broadcast, so this is where the clients' guess of our path starts from
+        self._trajectory = (self.x, self.y, self.destination_x, self.destination_y, self.speed, getattr(self, "state", None), self.aquarium.now)
         return(return_dict)
 
+thing_classes["Thing"] = Thing
+Thing._state_handlers = {}
+Thing._slot_names = list(Thing.__slots__)
+Thing._summary_getter = operator.attrgetter(*Thing.properties_to_broadcast)
+
+# Things used to store these on every instance, now they're class attributes
+CLASS_CONSTANTS = {
+    "class_hierarchy", "properties_to_broadcast", "aspect_ratio", "spritesheet_json", "default_texture",
+    "default_animation", "closed_texture", "empty_texture", "full_texture"
+}
+
+class FoodPreference():
+    # One compiled entry of Fish.food_preferences: (class_hierarchy, hunger threshold)
+    # The fish will go for this kind of food once its hunger is above the threshold
+    def __init__(self, class_hierarchy, hunger_threshold):
+        if isinstance(class_hierarchy, str):
+            # Older snapshots (and older fish) wrote these as strings like "['Thing', 'Food', 'Pellet']"
+            class_hierarchy = ast.literal_eval(class_hierarchy)
+        self.class_hierarchy = list(class_hierarchy)
+        self.hunger_threshold = hunger_threshold
+        self.is_fish = "Fish" in self.class_hierarchy
+        self.mask = class_mask(self.class_hierarchy)
+
+    def __getstate__(self):
+        # Class masks are only valid for this process, so recompute it when loading
+        state = self.__dict__.copy()
+        state.pop("mask", None)
+        return(state)
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.mask = class_mask(self.class_hierarchy)
+
+    def __iter__(self):
+        # So it still unpacks like the old (class_hierarchy, threshold) tuples
+        return(iter((self.class_hierarchy, self.hunger_threshold)))
+
+class Handle():
+    # A reference to a Thing by its label, looked up in aquarium.objects when it's used
+    # Labels already include the aquarium's generation and are never reused (see Aquarium.new_label),
+    # so a handle to a removed Thing resolves to None, even if the object itself was pooled and reused.
+    # Handles also don't keep removed Things alive (or pickle them along with whoever pointed at them)
+    __slots__ = ("label",)
+
+    def __init__(self, label):
+        self.label = label
+
+    def resolve(self, aquarium):
+        return(aquarium.objects.get(self.label))
+
+class HandleAttribute():
+    # An attribute that stores a Handle but reads back the object (or None once it's left the aquarium)
+    def __set_name__(self, owner, name):
+        self.name = "_" + name
+
+    def __get__(self, obj, objtype=None):
+        if obj is None:
+            return(self)
+        handle = obj.__dict__.get(self.name)
+        if handle is None:
+            return(None)
+        return(handle.resolve(obj.aquarium))
+
+    def __set__(self, obj, value):
+        # getattr because older snapshots stored the objects themselves, and they might not be loaded yet
+        label = getattr(value, "label", None)
+        obj.__dict__[self.name] = None if (label is None) else Handle(label)
+
 class Fish(Thing):
+    states = ("idle", "feeding", "fleeing", "playing")
+
+    # What the fish is going after (or away from), stored as Handles
+    food = HandleAttribute() # Food or Fish object
+    predator = HandleAttribute() # Fish object
+    plaything = HandleAttribute() # Fish or Tap or other object
+
+    # Redefine properties from Thing
+    spritesheet_json = "assets/things.json"
+    default_texture = "fish.png"
+    default_animation = None
+    aspect_ratio = 1
+    properties_to_broadcast = Thing.properties_to_broadcast + [
+        "fish_name", "state", "health", "happiness", "hunger", "top_relationships"
+    ]
+
+    # How often a fish runs _choose_state (seconds, 0 for every tick)
+    # Fish are staggered so they don't all decide on the same tick, and events (new food, a tap or a fish
+    # nearby, a target disappearing) make a fish decide again on its next update
+    decision_interval = 0.25
+    decision_event_radius = 300 # Pixels (new food, taps and fish only alert the fish this close, the rest notice them when they next decide)
+    flee_distance = 100 # Pixels (how close a bigger fish has to be before we flee, used by child classes)
+    _decision_countdown = 0 # Seconds until the next decision (a class default for older snapshots)
+
+    # Fast-forwarding (see fast_forward)
+    fast_forward_step = 60 # Longest step (seconds) we solve exactly before clamping health to [0, 1]
+    coin_fast_forward_window = 30 # Seconds (coins dropped before this would have expired already)
+
+    # Relationship storage limits (overwrite these in child classes if you want)
+    relationship_limit = 100 # Most users a fish remembers (the ones it likes least are forgotten first)
+    relationship_threshold = 0.001 # Relationships that decay below this are forgotten
+    relationship_prune_frequency = 3600 # Seconds between forgetting decayed relationships
+    public_relationship_count = 10 # How many relationships we broadcast (the strongest ones)
+
     def __init__(self, aquarium):
         
         # Redefine properties from Thing
         super().__init__(aquarium)
-        self.class_hierarchy.append("Fish")
-        self.spritesheet_json = "assets/things.json"
-        self.default_texture = "fish.png"
-        self.default_animation = None
-        self.aspect_ratio = 1
         self.width = 100 # Pixels (also a proxy for size!)
-        self.properties_to_broadcast.extend([
-            "fish_name", "state", "health", "happiness", "hunger", "relationships"
-        ])
 
         # Set the fish-specific properties
         self.fish_name = "unnamed_fish"
@@ -237,8 +802,8 @@ class Fish(Thing):
         self.hunger_rate = 1/2880000 # Hunger per second per speed per width (8 hours at speed=100 and width=100)
         self.starve_rate = 1/7200 # Health per second per (0.5-hunger) (2 hours at hunger=1)
         self.food_preferences = [ # Overwrite this in child classes!
-            ("['Thing', 'Food']", 0.9),
-            ("['Thing', 'Fish']", 0.1),
+            (["Thing", "Food"], 0.9),
+            (["Thing", "Fish"], 0.1),
         ]
 
         # Happiness properties (check `docs/fish.md` for more info)
@@ -249,33 +814,146 @@ class Fish(Thing):
         self.max_speed = 100 # Pixels per second
         self.coin_rate = 1/20 # On average, 1 coin per 20 seconds
 
+        # Stagger the first decision so fish spread out over the ticks
+        self._decision_countdown = random.uniform(0, self.decision_interval)
+
         # Keep a running tally of how much a fish likes a user (0 to 1)
+        # Stored as {username: (relationship, ms since epoch)} and decayed when it's read (see `relationships`)
         self.relationships = {} # {username: relationship_score (0 to 1)}
         self.relationship_decay_rate = 1/(86400) # Relationship per second per relationship (1 day but it's asympototic!)
+        # Sum of the relationships with users that are online right now (kept up to date by the Aquarium)
+        # Every relationship decays at the same rate, so the sum decays at that rate too
+        self._online_relationship_total = 0
+        self._online_relationship_time = aquarium.now
 
         # References for when the fish is in a certain state
         self.food = None # Food or Fish object
         self.predator = None # Fish object
         self.plaything = None # Fish or Tap or other object
     
+    @property
+    def food_preferences(self):
+        return(self._food_preferences)
+
+    @food_preferences.setter
+    def food_preferences(self, food_preferences):
+        # Compile the preferences once here instead of on every search
+        self._food_preferences = [preference if isinstance(preference, FoodPreference) else FoodPreference(*preference)
+                                  for preference in food_preferences]
+
+    @property
+    def relationships(self):
+        # {username: relationship} as of now
+        now = self.aquarium.now
+        return({username: self._decayed(value, last_updated, now) for username, (value, last_updated) in self._relationships.items()})
+
+    @relationships.setter
+    def relationships(self, relationships):
+        # A plain {username: relationship} dictionary (from __init__ or an older snapshot)
+        # Stamped with the simulation clock, so decay lines up with it after catch_up or fast_forward
+        now = getattr(getattr(self, "aquarium", None), "now", None)
+        if now is None:
+            now = time.time() * 1000 # Still unpickling, the aquarium isn't built yet
+        self._relationships = {username: (value, now) for username, value in relationships.items()}
+
+    @property
+    def top_relationships(self):
+        # The strongest few relationships, for broadcasting (relationships could be a lot bigger)
+        now = self.aquarium.now
+        strongest = heapq.nlargest(self.public_relationship_count, self._relationships.items(), key=lambda item: self._decayed(*item[1], now))
+        return({username: self._decayed(value, last_updated, now) for username, (value, last_updated) in strongest})
+
+    def relationship(self, username):
+        # How much we like one user right now (0 if we've never met)
+        entry = self._relationships.get(username)
+        if entry is None:
+            return(0)
+        return(self._decayed(entry[0], entry[1], self.aquarium.now))
+
+    def _decayed(self, value, last_updated, now):
+        # Exact solution of d(relationship)/dt = -relationship_decay_rate * relationship (check `docs/fish.md`)
+        elapsed = max(0, now - last_updated) / 1000 # Seconds
+        return(value * math.exp(-self.relationship_decay_rate * elapsed))
+
     @property
     def happiness(self): # Check `docs/fish.md` for more info on the calculation
-        total_happiness = 0
-        for username in self.aquarium.user_manager.online_users.keys():
-            total_happiness += self.relationships.get(username, 0)
+        total_happiness = self._online_relationships()
         total_happiness += self.hunger_happiness_bonus * (1 - self.hunger)
         total_happiness += self.health_happiness_bonus * self.health
         return(total_happiness)
 
+    def _online_relationships(self):
+        # Sum of the relationships with users that are currently online
+        return(self._decayed(self._online_relationship_total, self._online_relationship_time, self.aquarium.now))
+
+    def _adjust_online_relationships(self, amount):
+        self._online_relationship_total = max(0, self._online_relationships() + amount)
+        self._online_relationship_time = self.aquarium.now
+
+    def _is_online(self, username):
+        user_manager = self.aquarium.user_manager
+        return((user_manager is not None) and (username in user_manager.online_users))
+
+    def _add_relationship(self, username, amount):
+        # Change relationships through here so the online tally stays right
+        old_relationship = self.relationship(username)
+        new_relationship = max(0, min(1, old_relationship + amount))
+        self._relationships[username] = (new_relationship, self.aquarium.now)
+        if self._is_online(username):
+            self._adjust_online_relationships(new_relationship - old_relationship)
+        if len(self._relationships) > self.relationship_limit:
+            # Not the user we just changed, or a new user would be forgotten right away (they start out the weakest)
+            self._forget(min((other for other in self._relationships if other != username), key=self.relationship))
+
+    def _forget(self, username):
+        relationship = self.relationship(username)
+        del self._relationships[username]
+        if self._is_online(username):
+            self._adjust_online_relationships(-relationship)
+
+    def _prune_relationships(self, when=None):
+        # Forget relationships that have decayed to (almost) nothing, and the weakest ones over the limit
+        # Runs every relationship_prune_frequency seconds on the aquarium's timers
+        for username in [username for username in self._relationships if self.relationship(username) < self.relationship_threshold]:
+            self._forget(username)
+        if len(self._relationships) > self.relationship_limit:
+            keep = set(heapq.nlargest(self.relationship_limit, self._relationships, key=self.relationship))
+            for username in [username for username in self._relationships if username not in keep]:
+                self._forget(username)
+        self.aquarium.timers.schedule(self.aquarium.now + self.relationship_prune_frequency * 1000, self, "_prune_relationships")
+
+    def _schedule_timers(self):
+        super()._schedule_timers()
+        self._prune_relationships() # Also trims older snapshots right away
+
+    def _rebase(self, shift):
+        super()._rebase(shift)
+        self._relationships = {username: (value, last_updated + shift) for username, (value, last_updated) in self._relationships.items()}
+        self._online_relationship_time += shift
+
+    def _user_came_online(self, username):
+        self._adjust_online_relationships(self.relationship(username))
+
+    def _user_went_offline(self, username):
+        self._adjust_online_relationships(-self.relationship(username))
+
+    def _recount_online_relationships(self):
+        # Start the tally over from scratch (after loading, or if a lot of relationships changed at once)
+        user_manager = self.aquarium.user_manager
+        online_users = user_manager.online_users if (user_manager is not None) else {}
+        self._online_relationship_total = sum(self.relationship(username) for username in self._relationships if username in online_users)
+        self._online_relationship_time = self.aquarium.now
+
     def _eat(self, food):
         # Confirm that the fish is actually colliding with the food
         if self._is_colliding(food):
             # Make the fish like the user who fed it
             nutrition = getattr(food, "nutrition", food.width/10) # Default to the width of the food!
             if getattr(food, "username", None) is not None:
-                self.relationships[food.username] = self.relationships.get(food.username, 0) + nutrition
+                self._add_relationship(food.username, nutrition)
             self.hunger = max(0, min(1, self.hunger - nutrition))
             self.width += nutrition # TODO: Make this more sophisticated!
+            self.aquarium.object_moved(self) # We got bigger
             try:
                 food._die() # Only Fish will have a _die method
             except:
@@ -287,54 +965,122 @@ class Fish(Thing):
 
     def _find_food(self) -> tuple:
         # Find the object that the fish will eat (go through the food preferences)
-        closest_food = None
-        closest_distance = float("inf")
-        for food_hierarchy, food_preference in self.food_preferences:
-            food_hierarchy = eval(food_hierarchy)
-            if (self.hunger <= food_preference):
-                continue # Skip this food preference if the fish isn't hungry enough
-            food, distance = self._find_closest(class_hierarchy=food_hierarchy)
+        # Only preferences we're hungry enough for count, and we search for all of them in one pass
+        preferences = [preference for preference in self.food_preferences if self.hunger > preference.hunger_threshold]
+        if not preferences:
+            return(None, float("inf"))
+        closest = self.aquarium.find_nearest_each(self.x, self.y, [preference.class_hierarchy for preference in preferences], exclude=self.label)
+        for preference, (food, distance) in zip(preferences, closest):
             if (food is not None): # Stop on the first food found above the hunger threshold
-                if ("Fish" in food_hierarchy):
-                    if (food.width >= self.width):
-                        continue # If the food is a fish, make sure the eater is bigger)
+                if preference.is_fish and (food.width >= self.width):
+                    continue # If the food is a fish, make sure the eater is bigger
                 return(food, distance)
-        return(closest_food, closest_distance)
+        return(None, float("inf"))
 
     def _calculate_health(self, delta_time):
-        self.health += ((0.5 - self.hunger) * self.starve_rate - (0.5 - self.happiness) * self.happiness_health_rate) * delta_time.total_seconds()
+        if self._physics_slot is not None:
+            return # Handled by the physics engine
+        self.health += ((0.5 - self.hunger) * self.starve_rate - (0.5 - self.happiness) * self.happiness_health_rate) * delta_time
         if (self.health <= 0):
             self._die()
         self.health = max(0, min(1, self.health))
 
-    def _decay_relationships(self, delta_time):
-        # Decay all relationships
-        for username in self.relationships.keys():
-            current_relationship = self.relationships[username]
-            d_relationship = self.relationship_decay_rate * current_relationship * delta_time.total_seconds() * -1
-            self.relationships[username] = max(0, min(1, current_relationship + d_relationship))
-
     def _calculate_happiness(self, delta_time):
         # Placeholder for child classes to override with fish-specific behavior
         pass
 
     def _calculate_hunger(self, delta_time):
-        self.hunger += self.hunger_rate * self.speed * delta_time.total_seconds()
+        if self._physics_slot is not None:
+            return # Handled by the physics engine
+        self.hunger += self.hunger_rate * self.speed * delta_time
         self.hunger = max(0, min(self.hunger, 1))
 
     def _calculate_coin_drop(self, delta_time):
+        if self._physics_slot is not None:
+            return # Handled by the physics engine
         # TODO eventually make this more sophisticated (e.g. based on happiness, etc.)
-        if random.random() < (self.coin_rate * delta_time.total_seconds()):
+        if random.random() < (self.coin_rate * delta_time):
             self.aquarium.create_object("Coin", kwargs={"x": self.x, "y": self.y}, properties={})
 
+    def fast_forward(self, seconds):
+        # Skip ahead `seconds` in one step (see Aquarium.fast_forward)
+        if not self._fast_forward_metabolism(seconds):
+            return # We died
+        self._fast_forward_coins(seconds)
+        # Nobody saw what we did, so just swim on to our destination and decide what to do next when we're back
+        self._jump_toward_destination(seconds)
+        self._reconsider()
+
+    def _fast_forward_metabolism(self, seconds) -> bool:
+        # Exact solution of the hunger and health ODEs (check `docs/fish.md`) over `seconds`
+        # Health is clamped to [0, 1] (and we die at 0) after every fast_forward_step, like after every tick
+        # Returns False if the fish died
+        now = self.aquarium.now - seconds * 1000 # ms since epoch at the start of each step
+        remaining = seconds
+        while remaining > 0:
+            step = min(remaining, self.fast_forward_step)
+            # Hunger rises linearly until it reaches 1, so end the step there
+            hunger_slope = self.hunger_rate * self.speed if (self.hunger < 1) else 0
+            new_hunger = max(0, min(self.hunger + hunger_slope * step, 1))
+            if (hunger_slope > 0) and (new_hunger == 1):
+                step = (1 - self.hunger) / hunger_slope
+
+            # d(health)/dt = growth * health + constant + slope * t + online * exp(-relationship_decay_rate * t)
+            # (happiness depends on health, hunger and the decaying online relationships)
+            k = self.happiness_health_rate
+            growth = k * self.health_happiness_bonus
+            constant = (0.5 - self.hunger) * self.starve_rate + k * (self.hunger_happiness_bonus * (1 - self.hunger) - 0.5)
+            slope = -hunger_slope * (self.starve_rate + k * self.hunger_happiness_bonus)
+            online = k * self._decayed(self._online_relationship_total, self._online_relationship_time, now)
+            decay = self.relationship_decay_rate
+            if growth == 0:
+                constant_term, slope_term = step, step**2 / 2
+            else:
+                constant_term = math.expm1(growth * step) / growth
+                slope_term = (math.expm1(growth * step) - growth * step) / growth**2
+            if (growth + decay) == 0:
+                online_term = step
+            else:
+                online_term = (math.expm1(growth * step) - math.expm1(-decay * step)) / (growth + decay)
+            health = (math.exp(growth * step) * self.health + constant * constant_term
+                      + slope * slope_term + online * online_term)
+
+            self.hunger = new_hunger
+            if (health <= 0):
+                self.health = 0
+                self._die()
+                return(False)
+            self.health = max(0, min(1, health))
+            remaining -= step
+            now += step * 1000
+        return(True)
+
+    def _fast_forward_coins(self, seconds):
+        # Drop the coins we would have dropped (coin_rate is a Poisson process), but only the recent ones
+        # Each coin is backdated to when it dropped, so its lifetime runs from then (and not from the end of the
+        # fast-forward, or coins would pile up while the aquarium idles)
+        window = min(seconds, self.coin_fast_forward_window)
+        if self.coin_rate <= 0:
+            return
+        time_until_coin = random.expovariate(self.coin_rate)
+        while time_until_coin < window:
+            dropped_at = self.aquarium.now - (window - time_until_coin) * 1000
+            self.aquarium.create_object("Coin", kwargs={"x": self.x, "y": self.y}, properties={"time_created": dropped_at})
+            time_until_coin += random.expovariate(self.coin_rate)
+
     def _choose_state(self):
         # Placeholder for child classes to override with fish-specific behavior
         self.state = "idle"
 
+    def _reconsider(self):
+        # Run _choose_state on the next update instead of waiting for decision_interval
+        self._decision_countdown = 0
+
     def _playing(self, delta_time):
-        if (self.plaything is None) or (self.plaything not in self.aquarium.objects.values()):
+        if self.plaything is None: # Also None once it's gone
             self.state = "idle"
             self.plaything = None
+            self._reconsider()
         else:
             self._new_object_destination(self.plaything, speed=self.max_speed)
             self._move_toward_destination(delta_time)
@@ -349,28 +1095,29 @@ class Fish(Thing):
         self._move_toward_destination(delta_time)
 
     def _feeding(self, delta_time):
-        # Always set updated_this_loop to True for smoother frontend updates
-        self.updated_this_loop = True
+        # We don't need to broadcast every tick, the clients follow us toward our destination (see should_broadcast)
         # If the food is gone, return to idle state
-        if (self.food is None) or (self.food not in self.aquarium.objects.values()):
+        if self.food is None:
             self.state = "idle"
             self.food = None
-        if self._is_colliding(self.food): 
+            self._reconsider()
+        elif self._is_colliding(self.food): 
             self._eat(self.food)
             self.state = "idle"
             self.food = None
+            self._reconsider()
         # Otherwise, move towards the food
         else:
             self._new_object_destination(self.food, speed=self.max_speed)
             self._move_toward_destination(delta_time)
 
     def _fleeing(self, delta_time):
-        # Always set updated_this_loop to True for smoother frontend updates
-        self.updated_this_loop = True
+        # We don't need to broadcast every tick, the clients follow us toward our destination (see should_broadcast)
         # If the predator is gone, return to idle state
-        if (self.predator is None) or (self.predator not in self.aquarium.objects.values()):
+        if self.predator is None: # Also None once it's gone
             self.state = "idle"
             self.predator = None
+            self._reconsider()
         # Otherwise, move away from the predator
         else:
             # Set the destination to be 100 pixels away from the predator (in the opposite direction)
@@ -384,20 +1131,31 @@ class Fish(Thing):
         self._calculate_happiness(delta_time)
         self._calculate_hunger(delta_time)
         self._calculate_coin_drop(delta_time)
-        self._choose_state()
+        # Decide what to do every decision_interval seconds (or sooner if something happened nearby)
+        self._decision_countdown -= delta_time
+        if self._decision_countdown < 1e-9: # Not <= 0 (0.25 - 5 * 0.05 isn't exactly 0 in floating point)
+            self._decide()
         # State-specific behavior (this will also move the fish!)
-        if self.state == "idle":
-            self._idle(delta_time)
-        elif self.state == "feeding":
-            self._feeding(delta_time)
-        elif self.state == "fleeing":
-            self._fleeing(delta_time)
-        elif self.state == "playing":
-            self._playing(delta_time)
-        else:
-            try:
-                exec(f"self._{self.state}(delta_time)")
-            except:
-                Warning(f"Unknown fish state {self.state}")
-                self._idle(delta_time)
+        decision_countdown = self._decision_countdown
+        self._state_handler(self.state)(self, delta_time)
+        # If that made us reconsider (our food is gone), decide now instead of going idle for a tick
+        if self._decision_countdown < decision_countdown:
+            self._decide()
         return(self.updated_this_loop)
+
+    def _decide(self):
+        self._choose_state()
+        self._decision_countdown = max(0, self._decision_countdown) + self.decision_interval
+
+    @classmethod
+    def _state_handler(cls, state):
+        # Look up the method for a state (e.g. "feeding" -> _feeding) in the class's dispatch table
+        handler = cls._state_handlers.get(state)
+        if handler is None:
+            # Custom states just need a _<state> method (we only look it up once per class)
+            handler = getattr(cls, f"_{state}", None)
+            if not callable(handler):
+                print(f"Unknown fish state {state} for {cls.__name__}, falling back to idle")
+                handler = cls._idle
+            cls._state_handlers[state] = handler
+        return(handler)
@@ -3,25 +3,27 @@ from server.helper import get_random_name
 import random
 
 class Clownfish(Fish):
+    # Redefine properties from Fish
+    spritesheet_json = "assets/fish/clownfish.json"
+    default_texture = None
+    default_animation = "idle"
+    aspect_ratio = 1.3837209302
+    flee_distance = 200 # Pixels (how close a bigger fish has to be before we flee)
+
     def __init__(self, aquarium, **kwargs):
             
         # Redefine properties from Fish
         super().__init__(aquarium)
-        self.class_hierarchy.append("Clownfish")
-        self.spritesheet_json = "assets/fish/clownfish.json"
-        self.default_texture = None
-        self.default_animation = "idle"
         self.animation_prefix = "clownfish_"
-        self.aspect_ratio = 1.3837209302
         self.width = 120
         self.max_speed = 100
         self.fish_name = f"{get_random_name(first_letter='C')} the Clownfish"
         self.coin_rate = 1/10
 
         self.food_preferences = [ 
-            ("['Thing', 'Food', 'Pellet']", 0.1),
-            ("['Thing', 'Food', 'Flake']", 0.5),
-            ("['Thing', 'Fish']", 0.9),
+            (["Thing", "Food", "Pellet"], 0.1),
+            (["Thing", "Food", "Flake"], 0.5),
+            (["Thing", "Fish"], 0.9),
         ]
 
         # Set properties from kwargs
@@ -38,12 +40,12 @@ class Clownfish(Fish):
             self.state = "feeding"
             self.food = closest_food
         # Flee from larger predators
-        elif (predator_distance < 200) and (predator_width > 1.5*self.width):
+        elif (predator_distance < self.flee_distance) and (predator_width > 1.5*self.width):
             self.state = "fleeing"
             self.predator = closest_predator
         # If there are taps, then the fish will play if it likes the user (otherwise it will flee)
         elif (closest_tap is not None):
-            if (self.relationships.get(closest_tap.username, 0) > 0.5):
+            if (self.relationship(closest_tap.username) > 0.5):
                 self.state = "playing"
                 self.plaything = closest_tap
             else:
@@ -54,6 +56,12 @@ class Clownfish(Fish):
             self.state = "idle"
 
 class Guppy(Fish):
+    # Redefine properties from Fish
+    spritesheet_json = "assets/fish/guppy.json"
+    default_texture = None
+    default_animation = "idle"
+    flee_distance = 50 # Pixels (how close a bigger fish has to be before we flee)
+
     def __init__(self, aquarium, **kwargs):
 
         # Choose a random color for the guppy (if not specified)
@@ -63,10 +71,6 @@ class Guppy(Fish):
             
         # Redefine properties from Fish
         super().__init__(aquarium)
-        self.class_hierarchy.append("Guppy")
-        self.spritesheet_json = "assets/fish/guppy.json"
-        self.default_texture = None
-        self.default_animation = "idle"
         self.animation_prefix = f"guppy_{color}_"
         self.spect_ratio = 1.4496644295
         self.width = 40
@@ -75,9 +79,9 @@ class Guppy(Fish):
         self.coin_rate = 1/40
 
         self.food_preferences = [ 
-            ("['Thing', 'Food', 'Flake']", 0.1),
-            ("['Thing', 'Food', 'Pellet']", 0.5),
-            ("['Thing', 'Fish']", 1.0),
+            (["Thing", "Food", "Flake"], 0.1),
+            (["Thing", "Food", "Pellet"], 0.5),
+            (["Thing", "Fish"], 1.0),
         ]
 
         # Set properties from kwargs
@@ -90,7 +94,7 @@ class Guppy(Fish):
         closest_tap, tap_distance = self._find_closest(class_hierarchy=["Thing", "Tap"])
         predator_width = closest_predator.width if closest_predator is not None else 0
         # If the fish is being chased, it will prioritize fleeing
-        if (predator_distance < 50) and (predator_width > self.width):
+        if (predator_distance < self.flee_distance) and (predator_width > self.width):
             self.state = "fleeing"
             self.predator = closest_predator
         # If there is food nearby, it will prioritize feeding (thresholds set in self.food_preferences)
@@ -99,7 +103,7 @@ class Guppy(Fish):
             self.food = closest_food
         # If there are taps, then the fish will play if it likes the user (otherwise it will flee)
         elif (closest_tap is not None):
-            if (self.relationships.get(closest_tap.username, 0) > 0.5):
+            if (self.relationship(closest_tap.username) > 0.5):
                 self.state = "playing"
                 self.plaything = closest_tap
             else:
@@ -110,6 +114,13 @@ class Guppy(Fish):
             self.state = "idle"
 
 class Angelfish(Fish):
+    # Redefine properties from Fish
+    spritesheet_json = "assets/fish/angelfish.json"
+    default_texture = None
+    default_animation = "idle"
+    aspect_ratio = 1.2557377049
+    flee_distance = 300 # Pixels (how close a bigger fish has to be before we flee)
+
     def __init__(self, aquarium, **kwargs):
 
         # Choose a random color for the guppy (if not specified)
@@ -119,21 +130,16 @@ class Angelfish(Fish):
             
         # Redefine properties from Fish
         super().__init__(aquarium)
-        self.class_hierarchy.append("Angelfish")
-        self.spritesheet_json = "assets/fish/angelfish.json"
-        self.default_texture = None
-        self.default_animation = "idle"
         self.animation_prefix = f"angelfish_{color}_"
-        self.aspect_ratio = 1.2557377049
         self.width = 120
         self.max_speed = 100
         self.fish_name = f"{get_random_name(first_letter='A')} the Angelfish"
         self.coin_rate = 1/20 # Angelfish produce coins at a rate of 1 coin per 20 seconds (on average)
 
         self.food_preferences = [ 
-            ("['Thing', 'Food', 'Pellet']", 0.1),
-            ("['Thing', 'Food', 'Flake']", 0.5),
-            ("['Thing', 'Fish']", 0.9),
+            (["Thing", "Food", "Pellet"], 0.1),
+            (["Thing", "Food", "Flake"], 0.5),
+            (["Thing", "Fish"], 0.9),
         ]
 
         # Set properties from kwargs
@@ -146,7 +152,7 @@ class Angelfish(Fish):
         closest_tap, tap_distance = self._find_closest(class_hierarchy=["Thing", "Tap"])
         predator_width = closest_predator.width if closest_predator is not None else 0
         # If the fish is being chased, it will prioritize fleeing
-        if (predator_distance < 300) and (predator_width > self.width):
+        if (predator_distance < self.flee_distance) and (predator_width > self.width):
             self.state = "fleeing"
             self.predator = closest_predator
         # If there is food nearby, it will prioritize feeding (thresholds set in self.food_preferences)
@@ -155,7 +161,7 @@ class Angelfish(Fish):
             self.food = closest_food
         # If there are taps, then the fish will play if it likes the user (otherwise it will flee)
         elif (closest_tap is not None):
-            if (self.relationships.get(closest_tap.username, 0) > 0.2):
+            if (self.relationship(closest_tap.username) > 0.2):
                 self.state = "playing"
                 self.plaything = closest_tap
             else:
@@ -0,0 +1,202 @@
+import numpy as np
+
+# An optional vectorized engine for Thing movement and Fish metabolism
+# Positions, destinations, speeds, hunger and health live in contiguous NumPy arrays owned by the
+# Aquarium (structure-of-arrays), and one call to step() advances every object at once.
+# Things attached to the engine become thin views: reading thing.x reads the engine's array.
+# Enable it with aquarium.enable_physics_engine() -- without it, everything runs as plain Python.
+
+MOVEMENT_FIELDS = ["x", "y", "destination_x", "destination_y", "speed", "width"]
+METABOLISM_FIELDS = ["hunger", "health"]
+# Per-fish rates don't change after a fish is created, so we copy them in once when it's attached
+METABOLISM_CONSTANTS = ["hunger_rate", "starve_rate", "happiness_health_rate", "coin_rate",
+                        "hunger_happiness_bonus", "health_happiness_bonus"]
+
+class PhysicsField():
+    # A descriptor that reads/writes an engine array for attached Things and falls back to the
+    # normal attribute storage (instance __dict__ or a slot) for everything else
+    def __init__(self, name, fallback=None):
+        self.name = name
+        self.fallback = fallback # The descriptor we replaced (e.g. a slot), if there was one
+
+    def get_fallback(self, obj):
+        if self.fallback is not None:
+            return(self.fallback.__get__(obj, type(obj)))
+        try:
+            return(obj.__dict__[self.name])
+        except KeyError:
+            raise AttributeError(self.name)
+
+    def set_fallback(self, obj, value):
+        if self.fallback is not None:
+            self.fallback.__set__(obj, value)
+        else:
+            obj.__dict__[self.name] = value
+
+    def __get__(self, obj, objtype=None):
+        if obj is None:
+            return(self)
+        slot = obj._physics_slot
+        if slot is None:
+            return(self.get_fallback(obj))
+        return(obj.aquarium.physics.arrays[self.name].item(slot))
+
+    def __set__(self, obj, value):
+        slot = obj._physics_slot
+        if slot is None:
+            self.set_fallback(obj, value)
+        else:
+            obj.aquarium.physics.arrays[self.name][slot] = value
+
+def install_fields(cls, names):
+    # Swap the attributes on a class for PhysicsFields (only once, it's a global change)
+    for name in names:
+        current = cls.__dict__.get(name)
+        if isinstance(current, PhysicsField):
+            continue
+        setattr(cls, name, PhysicsField(name, fallback=current))
+
+class PhysicsEngine():
+    def __init__(self, aquarium, capacity=256):
+        self.aquarium = aquarium
+        self.capacity = capacity
+        self.count = 0
+        self.things = [] # {slot: Thing}, as a list
+
+        self.arrays = {}
+        for name in MOVEMENT_FIELDS + METABOLISM_FIELDS + METABOLISM_CONSTANTS:
+            self.arrays[name] = np.zeros(capacity)
+        # height = width / aspect_ratio, or a fixed height if the aspect ratio is None
+        self.arrays["aspect_ratio"] = np.full(capacity, np.nan)
+        self.arrays["fixed_height"] = np.zeros(capacity)
+        self.arrays["is_fish"] = np.zeros(capacity, dtype=bool)
+
+    def _grow(self):
+        self.capacity *= 2
+        for name, array in self.arrays.items():
+            grown = np.zeros(self.capacity, dtype=array.dtype)
+            grown[:len(array)] = array
+            self.arrays[name] = grown
+
+    def add(self, thing):
+        if thing._physics_slot is not None:
+            return
+        if self.count == self.capacity:
+            self._grow()
+        slot = self.count
+        # Copy the current values out of the Thing (we're not attached yet so these are plain attributes)
+        for name in MOVEMENT_FIELDS:
+            self.arrays[name][slot] = getattr(thing, name)
+        self.arrays["aspect_ratio"][slot] = np.nan if thing.aspect_ratio is None else thing.aspect_ratio
+        self.arrays["fixed_height"][slot] = thing._height
+        is_fish = "Fish" in thing.class_hierarchy
+        self.arrays["is_fish"][slot] = is_fish
+        if is_fish:
+            for name in METABOLISM_FIELDS + METABOLISM_CONSTANTS:
+                self.arrays[name][slot] = getattr(thing, name)
+        else:
+            for name in METABOLISM_FIELDS + METABOLISM_CONSTANTS:
+                self.arrays[name][slot] = 0
+        self.things.append(thing)
+        self.count += 1
+        thing._physics_slot = slot
+
+    def remove(self, thing):
+        slot = thing._physics_slot
+        if slot is None:
+            return
+        # Write the current values back to the Thing so it still makes sense once it's detached
+        values = {name: self.arrays[name].item(slot) for name in self._fields_for(slot)}
+        thing._physics_slot = None
+        for name, value in values.items():
+            setattr(thing, name, value)
+        # Move the last slot into the hole to keep the arrays contiguous
+        last = self.count - 1
+        if slot != last:
+            for array in self.arrays.values():
+                array[slot] = array[last]
+            moved = self.things[last]
+            self.things[slot] = moved
+            moved._physics_slot = slot
+        self.things.pop()
+        self.count -= 1
+
+    def detach_all(self):
+        while self.count > 0:
+            self.remove(self.things[-1])
+
+    def _fields_for(self, slot):
+        if self.arrays["is_fish"][slot]:
+            return(MOVEMENT_FIELDS + METABOLISM_FIELDS)
+        return(MOVEMENT_FIELDS)
+
+    def step(self, delta_seconds):
+        n = self.count
+        if n == 0:
+            return
+        self._step_movement(n, delta_seconds)
+        self._step_metabolism(n, delta_seconds)
+
+    def _step_movement(self, n, delta_seconds):
+        # Same math as Thing._move_toward_destination, for every attached Thing at once
+        a = self.arrays
+        x, y = a["x"][:n], a["y"][:n]
+        destination_x, destination_y = a["destination_x"][:n], a["destination_y"][:n]
+        speed, width = a["speed"][:n], a["width"][:n]
+        aspect_ratio = a["aspect_ratio"][:n]
+        height = np.where(np.isnan(aspect_ratio), a["fixed_height"][:n], width / np.where(np.isnan(aspect_ratio), 1, aspect_ratio))
+        max_x = self.aquarium.width - width
+        max_y = self.aquarium.height - height
+
+        direction = np.arctan2(destination_y - y, destination_x - x)
+        new_x = np.maximum(0, np.minimum(speed * np.cos(direction) * delta_seconds + x, max_x))
+        new_y = np.maximum(0, np.minimum(speed * np.sin(direction) * delta_seconds + y, max_y))
+        # Make sure we haven't overshot the destination
+        new_x = np.where((destination_x - x) * (destination_x - new_x) < 0, destination_x, new_x)
+        new_y = np.where((destination_y - y) * (destination_y - new_y) < 0, destination_y, new_y)
+        new_x = np.maximum(0, np.minimum(new_x, max_x))
+        new_y = np.maximum(0, np.minimum(new_y, max_y))
+
+        # Things that aren't moving (treasure chests, taps) stay exactly where they are
+        moving = speed != 0
+        new_x = np.where(moving, new_x, x)
+        new_y = np.where(moving, new_y, y)
+
+        # Only tell the spatial index about Things that changed cells
+        cell_size = self.aquarium.spatial_index.cell_size
+        changed_cell = ((np.floor(new_x / cell_size) != np.floor(x / cell_size)) |
+                        (np.floor(new_y / cell_size) != np.floor(y / cell_size)))
+        x[:] = new_x
+        y[:] = new_y
+        for slot in np.flatnonzero(changed_cell):
+            self.aquarium.object_moved(self.things[slot])
+
+    def _step_metabolism(self, n, delta_seconds):
+        # Same math as Fish._calculate_health, _calculate_hunger and _calculate_coin_drop
+        a = self.arrays
+        is_fish = a["is_fish"][:n]
+        if not is_fish.any():
+            return
+        hunger, health = a["hunger"][:n], a["health"][:n]
+
+        # Happiness needs the relationships with online users, which only the Fish knows about
+        online_relationships = np.zeros(n)
+        for slot in np.flatnonzero(is_fish):
+            online_relationships[slot] = self.things[slot]._online_relationships()
+        happiness = (online_relationships + a["hunger_happiness_bonus"][:n] * (1 - hunger)
+                     + a["health_happiness_bonus"][:n] * health)
+
+        new_health = health + ((0.5 - hunger) * a["starve_rate"][:n]
+                               - (0.5 - happiness) * a["happiness_health_rate"][:n]) * delta_seconds
+        new_hunger = np.clip(hunger + a["hunger_rate"][:n] * a["speed"][:n] * delta_seconds, 0, 1)
+        health[:] = np.where(is_fish, np.clip(new_health, 0, 1), health)
+        hunger[:] = np.where(is_fish, new_hunger, hunger)
+
+        # Collect the Fish that die or drop coins first (dying changes the slots!)
+        dying = [self.things[slot] for slot in np.flatnonzero(is_fish & (new_health <= 0))]
+        coin_rolls = np.random.random(n) < a["coin_rate"][:n] * delta_seconds
+        dropping = [self.things[slot] for slot in np.flatnonzero(is_fish & coin_rolls)]
+        for fish in dropping:
+            self.aquarium.create_object("Coin", kwargs={"x": fish.x, "y": fish.y}, properties={})
+        for fish in dying:
+            fish._die()
@@ -0,0 +1,47 @@
+# A free list of removed Things so the short-lived ones (bubbles, coins, food, taps) can be reused
+# Only classes with `pooled = True` go in here. Reusing an object just runs its __init__ again
+# (on a slotted Thing that overwrites every attribute) instead of allocating a new one.
+POOL_SIZE = 1024 # Most objects we keep around per class
+
+class EntityPool():
+    def __init__(self, max_size=POOL_SIZE):
+        self.max_size = max_size
+        self.free = {} # {class: [object, ...]}
+        # Objects removed this tick aren't reused until the next one, so anything still holding a
+        # reference to them (a fish chasing an eaten flake) sees them disappear before they come back
+        self.released = []
+
+        # Stats
+        self.created = 0
+        self.reused = 0
+
+    def __len__(self):
+        return(sum(len(objects) for objects in self.free.values()))
+
+    def new(self, thing_class, aquarium, kwargs={}):
+        # Build a Thing, reusing a removed one of the same class if we have one
+        free = self.free.get(thing_class)
+        if free:
+            new_object = free.pop()
+            thing_class.__init__(new_object, aquarium, **kwargs)
+            self.reused += 1
+        else:
+            new_object = thing_class(aquarium, **kwargs)
+            self.created += 1
+        return(new_object)
+
+    def release(self, object):
+        if type(object).pooled:
+            self.released.append(object)
+
+    def recycle(self):
+        # Call once per tick: objects released last tick become available for reuse
+        for object in self.released:
+            free = self.free.setdefault(type(object), [])
+            if len(free) < self.max_size:
+                free.append(object)
+        self.released = []
+
+    def clear(self):
+        self.free = {}
+        self.released = []
@@ -0,0 +1,213 @@
+import math
+
+# A uniform grid (spatial hash) of Things in the Aquarium
+# Things are bucketed by the cell that their (x, y) position falls into, so neighbor queries
+# only have to look at nearby cells instead of every object in aquarium.objects.
+# REMEMBER the position of an object is its top-left corner (that's what we index)!
+class SpatialHash():
+    def __init__(self, cell_size=64):
+        self.cell_size = cell_size
+        self.cells = {} # {(cell_x, cell_y): {label: object}}
+        self.object_cells = {} # {label: (cell_x, cell_y)}
+
+        # Bounds of the occupied cells so ring searches know when to stop
+        self.min_cell = None
+        self.max_cell = None
+
+        # Largest object seen so far (for bounding-box queries, since we only index the top-left corner)
+        self.max_width = 0
+        self.max_height = 0
+
+    def __len__(self):
+        return(len(self.object_cells))
+
+    def _cell(self, x, y):
+        return((math.floor(x / self.cell_size), math.floor(y / self.cell_size)))
+
+    def _grow_bounds(self, cell):
+        if self.min_cell is None:
+            self.min_cell = cell
+            self.max_cell = cell
+        else:
+            self.min_cell = (min(self.min_cell[0], cell[0]), min(self.min_cell[1], cell[1]))
+            self.max_cell = (max(self.max_cell[0], cell[0]), max(self.max_cell[1], cell[1]))
+
+    def _grow_extent(self, object):
+        self.max_width = max(self.max_width, object.width)
+        self.max_height = max(self.max_height, object.height)
+
+    def insert(self, object):
+        cell = self._cell(object.x, object.y)
+        self.cells.setdefault(cell, {})[object.label] = object
+        self.object_cells[object.label] = cell
+        self._grow_bounds(cell)
+        self._grow_extent(object)
+
+    def remove(self, object):
+        cell = self.object_cells.pop(object.label, None)
+        if cell is None:
+            return
+        bucket = self.cells[cell]
+        bucket.pop(object.label, None)
+        if not bucket:
+            del self.cells[cell]
+        # We don't shrink the bounds here (they're only used to stop searching, so too big is fine)
+
+    def move(self, object) -> bool:
+        # Call this whenever an indexed object changes position (cheap if it stays in the same cell)
+        # Returns True if the object moved to a different cell
+        old_cell = self.object_cells.get(object.label)
+        if old_cell is None:
+            return(False)
+        new_cell = self._cell(object.x, object.y)
+        changed_cell = new_cell != old_cell
+        if changed_cell:
+            bucket = self.cells[old_cell]
+            bucket.pop(object.label, None)
+            if not bucket:
+                del self.cells[old_cell]
+            self.cells.setdefault(new_cell, {})[object.label] = object
+            self.object_cells[object.label] = new_cell
+            self._grow_bounds(new_cell)
+        self._grow_extent(object)
+        return(changed_cell)
+
+    def clear(self):
+        self.cells = {}
+        self.object_cells = {}
+        self.min_cell = None
+        self.max_cell = None
+        self.max_width = 0
+        self.max_height = 0
+
+    def _ring(self, center, r):
+        # All cells exactly r cells away from the center (Chebyshev distance), clipped to the occupied bounds
+        cx, cy = center
+        if r == 0:
+            yield center
+            return
+        min_x, min_y = self.min_cell
+        max_x, max_y = self.max_cell
+        for dx in range(max(-r, min_x - cx), min(r, max_x - cx) + 1):
+            if cy - r >= min_y:
+                yield (cx + dx, cy - r)
+            if cy + r <= max_y:
+                yield (cx + dx, cy + r)
+        for dy in range(max(-r + 1, min_y - cy), min(r - 1, max_y - cy) + 1):
+            if cx - r >= min_x:
+                yield (cx - r, cy + dy)
+            if cx + r <= max_x:
+                yield (cx + r, cy + dy)
+
+    def _ring_clearance(self, x, y, center, r):
+        # Smallest possible distance from (x, y) to anything in ring r (or further out)
+        if r == 0:
+            return(0)
+        cx, cy = center
+        size = self.cell_size
+        return(min(x - (cx - r + 1) * size, (cx + r) * size - x,
+                   y - (cy - r + 1) * size, (cy + r) * size - y))
+
+    def _max_ring(self, center):
+        cx, cy = center
+        return(max(cx - self.min_cell[0], self.max_cell[0] - cx, cy - self.min_cell[1], self.max_cell[1] - cy, 0))
+
+    def nearest(self, x, y, predicate=None, exclude=None) -> tuple:
+        # Find the closest object to (x, y) that passes the predicate (and isn't labeled `exclude`)
+        # Returns (object, distance) just like Thing._find_closest -- (None, inf) if nothing matches
+        closest = None
+        closest_distance = float("inf")
+        if self.min_cell is None:
+            return(closest, closest_distance)
+        center = self._cell(x, y)
+        for r in range(self._max_ring(center) + 1):
+            if closest_distance <= self._ring_clearance(x, y, center, r):
+                break # Nothing further out can be closer than what we've already found
+            for cell in self._ring(center, r):
+                bucket = self.cells.get(cell)
+                if bucket is None:
+                    continue
+                for label, obj in bucket.items():
+                    if label == exclude:
+                        continue
+                    if (predicate is not None) and (not predicate(obj)):
+                        continue
+                    distance = math.sqrt((x - obj.x)**2 + (y - obj.y)**2)
+                    if distance < closest_distance:
+                        closest = obj
+                        closest_distance = distance
+        return(closest, closest_distance)
+
+    def nearest_each(self, x, y, predicates, exclude=None) -> list:
+        # Like nearest(), but finds the closest match for several predicates in one pass over the cells
+        # Returns a list of (object, distance) tuples in the same order as the predicates
+        closest = [(None, float("inf")) for _ in predicates]
+        if (self.min_cell is None) or (not predicates):
+            return(closest)
+        center = self._cell(x, y)
+        for r in range(self._max_ring(center) + 1):
+            clearance = self._ring_clearance(x, y, center, r)
+            if all(distance <= clearance for _, distance in closest):
+                break # Nothing further out can beat any of the matches we already have
+            for cell in self._ring(center, r):
+                bucket = self.cells.get(cell)
+                if bucket is None:
+                    continue
+                for label, obj in bucket.items():
+                    if label == exclude:
+                        continue
+                    distance = None
+                    for i, predicate in enumerate(predicates):
+                        if not predicate(obj):
+                            continue
+                        if distance is None:
+                            distance = math.sqrt((x - obj.x)**2 + (y - obj.y)**2)
+                        if distance < closest[i][1]:
+                            closest[i] = (obj, distance)
+        return(closest)
+
+    def query_radius(self, x, y, radius, predicate=None, exclude=None) -> list:
+        # All objects within `radius` of (x, y) as a list of (object, distance) tuples
+        results = []
+        if self.min_cell is None:
+            return(results)
+        min_cell = self._cell(x - radius, y - radius)
+        max_cell = self._cell(x + radius, y + radius)
+        for cell_x in range(max(min_cell[0], self.min_cell[0]), min(max_cell[0], self.max_cell[0]) + 1):
+            for cell_y in range(max(min_cell[1], self.min_cell[1]), min(max_cell[1], self.max_cell[1]) + 1):
+                bucket = self.cells.get((cell_x, cell_y))
+                if bucket is None:
+                    continue
+                for label, obj in bucket.items():
+                    if label == exclude:
+                        continue
+                    if (predicate is not None) and (not predicate(obj)):
+                        continue
+                    distance = math.sqrt((x - obj.x)**2 + (y - obj.y)**2)
+                    if distance <= radius:
+                        results.append((obj, distance))
+        return(results)
+
+    def query_rect(self, x, y, width, height, predicate=None, exclude=None) -> list:
+        # All objects whose bounding boxes overlap the box with top-left (x, y) and the given size
+        # Same overlap test as Thing._is_colliding
+        results = []
+        if self.min_cell is None:
+            return(results)
+        # Objects are indexed by their top-left corner, so look up and left by the largest object size
+        min_cell = self._cell(x - self.max_width, y - self.max_height)
+        max_cell = self._cell(x + width, y + height)
+        for cell_x in range(max(min_cell[0], self.min_cell[0]), min(max_cell[0], self.max_cell[0]) + 1):
+            for cell_y in range(max(min_cell[1], self.min_cell[1]), min(max_cell[1], self.max_cell[1]) + 1):
+                bucket = self.cells.get((cell_x, cell_y))
+                if bucket is None:
+                    continue
+                for label, obj in bucket.items():
+                    if label == exclude:
+                        continue
+                    if (predicate is not None) and (not predicate(obj)):
+                        continue
+                    if (x < obj.x + obj.width and x + width > obj.x and
+                        y < obj.y + obj.height and y + height > obj.y):
+                        results.append(obj)
+        return(results)
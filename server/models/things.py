@@ -1,20 +1,24 @@
 from server.models.aquarium import Thing
-import datetime, random, math
+import random, math
 
 class Food(Thing):
+    __slots__ = ("username", "nutrition")
+    pooled = True
+
+    # Redefine properties from Thing
+    spritesheet_json = "assets/things.json"
+    default_texture = "pellet.png"
+    default_animation = None
+    aspect_ratio = 1
+    properties_to_broadcast = Thing.properties_to_broadcast + [
+        "nutrition"
+    ]
+
     def __init__(self, aquarium, x, y, username=None):
 
         # Redefine properties from Thing
         super().__init__(aquarium)
-        self.class_hierarchy.append("Food")
-        self.spritesheet_json = "assets/things.json"
-        self.default_texture = "pellet.png"
-        self.default_animation = None
-        self.aspect_ratio = 1
         self.width = 10
-        self.properties_to_broadcast.extend([
-            "nutrition"
-        ])
 
         # Set the food-specific properties
         self.username = username
@@ -31,46 +35,57 @@ class Food(Thing):
     def update(self, delta_time):
         self.updated_this_loop = False
         self._move_toward_destination(delta_time)
-        self._calculate_lifetime()
+        # Our lifetime is a timer (see Thing._schedule_lifetime), so there's nothing to do once we're on the floor
+        self._sleep_if_at_rest()
 
 class Flake(Food):
+    __slots__ = ()
+
+    # Redefine properties from Food
+    default_texture = "flake.png"
+    aspect_ratio = 2.6833333333
+
     def __init__(self, aquarium, x, y, username=None):
         # Redefine properties from Food
         super().__init__(aquarium, x=x, y=y, username=username)
-        self.class_hierarchy.append("Flake")
-        self.default_texture = "flake.png"
-        self.aspect_ratio = 2.6833333333
         self.width = 10
         # Set the flake-specific properties
         self.lifetime = 20 # Seconds
         self.speed = 10
 
 class Pellet(Food):
+    __slots__ = ()
+
+    # Redefine properties from Food
+    default_texture = "pellet.png"
+    aspect_ratio = 1
+
     def __init__(self, aquarium, x, y, username=None):
         # Redefine properties from Food
         super().__init__(aquarium, x=x, y=y, username=username)
-        self.class_hierarchy.append("Pellet")
-        self.default_texture = "pellet.png"
-        self.aspect_ratio = 1
         self.width = 10
         # Set the pellet-specific properties
         self.lifetime = 60 # Seconds
         self.speed = 20
 
 class Coin(Thing):
+    __slots__ = ("value", "floor_lifetime")
+    pooled = True
+
+    # Redefine properties from Thing
+    spritesheet_json = "assets/things.json"
+    default_texture = "coin.png"
+    default_animation = None
+    aspect_ratio = 1
+    properties_to_broadcast = Thing.properties_to_broadcast + [
+        "value"
+    ]
+
     def __init__(self, aquarium, x=None, y=None):
 
         # Redefine properties from Thing
         super().__init__(aquarium)
-        self.class_hierarchy.append("Coin")
-        self.spritesheet_json = "assets/things.json"
-        self.default_texture = "coin.png"
-        self.default_animation = None
-        self.aspect_ratio = 1
         self.width = 20
-        self.properties_to_broadcast.extend([
-            "value"
-        ])
 
         # Set the coin-specific properties
         self.value = 0.01
@@ -87,11 +102,12 @@ class Coin(Thing):
     def update(self, delta_time):
         self.updated_this_loop = False
         self._move_toward_destination(delta_time)
-        self._calculate_lifetime()
 
-        if (self.y >= self.destination_y):
+        if (self.y >= self.destination_y) and (self.lifetime != self.floor_lifetime):
             # If the coin has hit the floor change the lifetime
             self.lifetime = self.floor_lifetime # Kind of an elegant way to do this :)
+            self._schedule_lifetime()
+        self._sleep_if_at_rest()
 
     def click(self, user):
         user.money = round(user.money + self.value, 2)
@@ -99,32 +115,35 @@ class Coin(Thing):
         self.remove()
 
 class TreasureChest(Thing):
+    # Redefine properties from Thing
+    spritesheet_json = "assets/things.json"
+    default_texture = "treasure_chest_closed.png"
+    default_animation = None
+    aspect_ratio = 1.361328125
+    properties_to_broadcast = Thing.properties_to_broadcast + [
+        "state", "value", "closed_texture", "empty_texture", "full_texture"
+    ]
+
+    # Chest-specific textures
+    closed_texture = "treasure_chest_closed.png"
+    empty_texture = "treasure_chest_empty.png"
+    full_texture = "treasure_chest_full.png"
+
     def __init__(self, aquarium, x=None, y=None):
 
         # Redefine properties from Thing
         super().__init__(aquarium)
-        self.class_hierarchy.append("TreasureChest")
-        self.spritesheet_json = "assets/things.json"
-        self.default_texture = "treasure_chest_closed.png"
-        self.default_animation = None
-        self.aspect_ratio = 1.361328125
         self.width = 174.25
-        self.properties_to_broadcast.extend([
-            "state", "value", "closed_texture", "empty_texture", "full_texture"
-        ])
 
         # Set the chest-specific properties
-        self.closed_texture = "treasure_chest_closed.png"
-        self.empty_texture = "treasure_chest_empty.png"
-        self.full_texture = "treasure_chest_full.png"
         self.state = "closed" # "closed", "empty", "full"
         self.value_range = (0.05, 0.25) # Random value when the chest is full
         self.value = round(random.uniform(*self.value_range), 2) # Set an initial value
         self.duty_cycle = (4, 6) # Seconds closed, seconds open
         self.full_probability = 0.1 # Probability of the chest being full when it opens
-        self.last_change = datetime.datetime.now().timestamp() * 1000 # ms since epoch (last state change)
+        self.last_change = aquarium.now # ms since epoch (last state change)
         self.bubble_freqeuency = 1.5 # Seconds between bubbles
-        self.last_bubble = datetime.datetime.now().timestamp() * 1000 # ms since epoch (last bubble)
+        self.last_bubble = aquarium.now # ms since epoch (last bubble)
 
         # Set the chest's position and make it not move 
         # # (also we won't call _move_toward_destination in update)
@@ -134,61 +153,96 @@ class TreasureChest(Thing):
         self.destination_y = y
         self.speed = 0
 
-    def _calculate_state(self):
-        time_since_change = datetime.datetime.now().timestamp() * 1000 - self.last_change # ms
+    def _schedule_timers(self):
+        super()._schedule_timers()
+        self._schedule_state_change()
+        self._schedule_bubble()
+
+    def _schedule_state_change(self):
+        duration = self.duty_cycle[0] if (self.state == "closed") else self.duty_cycle[1]
+        self.aquarium.timers.schedule(self.last_change + duration * 1000, self, "_calculate_state")
+
+    def _schedule_bubble(self):
+        if self.state == "empty":
+            self.aquarium.timers.schedule(self.last_bubble + self.bubble_freqeuency * 1000, self, "_emit_bubbles")
+
+    def _calculate_state(self, when):
+        # Called by the aquarium's timers when the current part of the duty cycle is over
+        time_since_change = self.aquarium.now - self.last_change # ms
         if (self.state == "closed"):
-            if (time_since_change > (self.duty_cycle[0] * 1000)):
+            if (time_since_change >= (self.duty_cycle[0] * 1000)):
                 # Open the chest and make it full or empty and reset the timer
                 self.state = "full" if random.random() < self.full_probability else "empty"
                 self.value = round(random.uniform(*self.value_range), 2) # No need for an if statement here (won't be clikable if empty)
-                self.last_change = datetime.datetime.now().timestamp() * 1000
-                self.updated_this_loop = True
+                self.last_change = self.aquarium.now
+                self._state_changed()
         elif (self.state in ["empty", "full"]):
-            if (time_since_change > (self.duty_cycle[1] * 1000)):
+            if (time_since_change >= (self.duty_cycle[1] * 1000)):
                 # Close the chest and reset the timer
                 self.state = "closed"
-                self.last_change = datetime.datetime.now().timestamp() * 1000
-                self.updated_this_loop = True
+                self.last_change = self.aquarium.now
+                self._state_changed()
         else:
             raise ValueError(f"Invalid state: {self.state}")
 
-    def _emit_bubbles(self):
+    def _rebase(self, shift):
+        super()._rebase(shift)
+        self.last_change += shift
+        self.last_bubble += shift
+
+    def _latest_timestamp(self):
+        return(max(super()._latest_timestamp(), self.last_change, self.last_bubble))
+
+    def _state_changed(self):
+        self._schedule_state_change()
+        self._schedule_bubble()
+        self.mark_dirty() # We're asleep (chests only change on timers)
+        # Timers run before the Things update, so broadcast the change directly (like add_object does)
+        self.aquarium.broadcast_updates.append(self.summarize)
+
+    def _emit_bubbles(self, when):
         # Emit bubbles when there is no treasure in the chest
-        time_since_bubble = datetime.datetime.now().timestamp() * 1000 - self.last_bubble # ms
-        if (self.state == "empty") and (time_since_bubble > (self.bubble_freqeuency * 1000)):
+        # (if this timer is stale the chest has closed, or another bubble timer is already going)
+        time_since_bubble = self.aquarium.now - self.last_bubble # ms
+        if (self.state == "empty") and (time_since_bubble >= (self.bubble_freqeuency * 1000)):
             # Don't forget pivot is center of the object (when rendering!)
             bubble_x = random.randrange(math.ceil(self.x - self.width/3), math.floor(self.x + self.width/3))
             bubble_y = self.y - (random.random() * self.height/3) # Looks good, I think :)
-            bubble = Bubble(self.aquarium, bubble_x, bubble_y)
+            bubble = self.aquarium.new_object("Bubble", kwargs={"x": bubble_x, "y": bubble_y})
             self.aquarium.add_object(bubble)
-            self.last_bubble = datetime.datetime.now().timestamp() * 1000
+            self.last_bubble = self.aquarium.now
+            self._schedule_bubble()
 
     def update(self, delta_time):
         self.updated_this_loop = False
-        self._calculate_state()
-        self._emit_bubbles()
+        # Everything a chest does is on a timer (_calculate_state and _emit_bubbles)
+        self.sleep()
 
     def click(self, user):
         # If it's full, give the user the money and set the state to empty
         if self.state == "full":
             self.state = "empty"
             self.updated_this_loop = True
+            self._schedule_bubble()
             user.money = round(user.money + self.value, 2)
             user.save()
 
 class Bubble(Thing):
+    __slots__ = ()
+    pooled = True
+
+    # Redefine properties from Thing
+    spritesheet_json = "assets/things.json"
+    default_texture = "bubble.png"
+    default_animation = None
+    aspect_ratio = 1
+    # No bubble-specific properties to broadcast!
+
     def __init__(self, aquarium, x, y):
 
         # Redefine properties from Thing
         super().__init__(aquarium)
-        self.class_hierarchy.append("Bubble")
-        self.spritesheet_json = "assets/things.json"
-        self.default_texture = "bubble.png"
-        self.default_animation = None
-        self.aspect_ratio = 1
         self.width = random.randint(20, 40)
-        # self.properties_to_broadcast.extend([])
-        # No bubble-specific properties!
 
         # Make the bubble rise
         self.x = x 
@@ -204,17 +258,18 @@ class Bubble(Thing):
             self.remove() # Pop the bubble when it reaches the top (no animation for now)
 
 class Skeleton(Thing):
+    # Redefine properties from Thing
+    spritesheet_json = "assets/things.json"
+    default_texture = "skeleton.png"
+    default_animation = None
+    aspect_ratio = 2.4903225806
+
     def __init__(self, aquarium, fish):
 
         # Redefine properties from Thing
         super().__init__(aquarium)
-        self.class_hierarchy.append("Skeleton")
-        self.spritesheet_json = "assets/things.json"
-        self.default_texture = "skeleton.png"
-        self.default_animation = None
         
         # Make the skeleton look like its fish
-        self.aspect_ratio = 2.4903225806
         self.width = fish.width
         self.x = fish.x
         self.y = fish.y
@@ -224,22 +279,30 @@ class Skeleton(Thing):
         self.destination_y = aquarium.height - self.height
         self.speed = 20
 
+    def update(self, delta_time):
+        self._move_toward_destination(delta_time)
+        self._sleep_if_at_rest() # Skeletons just lie on the floor
+
 class Tap(Thing):
     # A very abstract "Thing" but easy to implement as one :)
+    __slots__ = ("username",)
+    pooled = True
+
+    # Redefine properties from Thing
+    spritesheet_json = "assets/tap.json"
+    default_texture = None
+    default_animation = "tap"
+    aspect_ratio = 1
+    properties_to_broadcast = Thing.properties_to_broadcast + [
+        "username"
+    ]
+
     def __init__(self, aquarium, x, y, username):
 
         # Redefine properties from Thing
         super().__init__(aquarium)
-        self.class_hierarchy.append("Tap")
-        self.spritesheet_json = "assets/tap.json"
-        self.default_texture = None
-        self.default_animation = "tap"
-        self.aspect_ratio = 1
         self.width = 40
         self.lifetime = 5 # Seconds
-        self.properties_to_broadcast.extend([
-            "username"
-        ])
 
         # Set the tap-specific properties
         self.username = username 
@@ -254,5 +317,6 @@ class Tap(Thing):
 
     def update(self, delta_time):
         self.updated_this_loop = False
-        self._calculate_lifetime()
+        # Our lifetime is a timer (see Thing._schedule_lifetime)
         # All taps do is exist for a bit and then disappear
+        self.sleep()
@@ -0,0 +1,31 @@
+import heapq
+
+# Deadlines that Things register with their Aquarium (lifetimes, coin floor timeouts, chest cycles, bubbles)
+# A min-heap ordered by time, so each tick only looks at the timers that are actually due instead of
+# every object checking the clock in its update().
+# Times are ms since epoch, same as Aquarium.now and Thing.time_created.
+class TimerQueue():
+    def __init__(self):
+        self.heap = [] # [(when, sequence, label, object, method_name)]
+        self.sequence = 0 # Tie-breaker so heapq never has to compare two objects
+
+    def __len__(self):
+        return(len(self.heap))
+
+    def schedule(self, when, object, method_name):
+        # Call object.<method_name>(when) once the aquarium clock reaches `when`
+        self.sequence += 1
+        heapq.heappush(self.heap, (when, self.sequence, object.label, object, method_name))
+
+    def run_due(self, now, objects):
+        # Run every timer that's due, skipping ones for objects that have left the aquarium (`objects`)
+        # There's no cancelling: callbacks should check that their deadline still applies
+        heap = self.heap
+        while heap and heap[0][0] <= now:
+            when, _, label, object, method_name = heapq.heappop(heap)
+            if objects.get(label) is object:
+                getattr(object, method_name)(when)
+
+    def clear(self):
+        self.heap = []
+        self.sequence = 0
@@ -151,6 +151,16 @@ class UserManager():
         self.online_users = {} # Keys are username, values are User or GuestUser objects
         self.guest_users = {} # Keys are username, values are GuestUser objects
         # Maybe we should use a database to store guest users?
+        # Objects with user_came_online(username) and user_went_offline(username) methods (e.g. the Aquarium)
+        self.listeners = []
+
+    def add_listener(self, listener):
+        if listener not in self.listeners:
+            self.listeners.append(listener)
+
+    def remove_listener(self, listener):
+        if listener in self.listeners:
+            self.listeners.remove(listener)
 
     # These properties only matter for users that are currently online -- no need to save them
     def attach_temp_properties(self, user):
@@ -169,7 +179,11 @@ class UserManager():
         if not user.is_authenticated:
             self.guest_users[user.username] = user
         user.last_seen = datetime.datetime.now().timestamp() # ms since epoch
+        came_online = user.username not in self.online_users
         self.online_users[user.username] = user
+        if came_online: # Not if they just opened another tab
+            for listener in self.listeners:
+                listener.user_came_online(user.username)
 
     def user_disconnected(self, user):
         user.last_seen = datetime.datetime.now().timestamp()
@@ -177,3 +191,5 @@ class UserManager():
             user.save()
         if (user.username in self.online_users):
             del self.online_users[user.username]
+            for listener in self.listeners:
+                listener.user_went_offline(user.username)
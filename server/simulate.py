@@ -4,30 +4,126 @@ from server.models.aquarium import Fish, Aquarium
 from server.models.fish import Clownfish, Guppy, Angelfish
 from server.models.things import *
 from server.models.user import User
+from server.broadcast import Broadcaster
 from datetime import datetime, timezone
 import time, random
 
 # Move this to a config file later
 SIMULATION_TICK = 0.05 # seconds per tick
-SYNC_FREQUENCY = 1 # seconds per sync
 BACKUP_FREQUENCY = 900 # seconds per backup (15 minutes)
+MAX_CATCH_UP_STEPS = 5 # most ticks we'll simulate in one loop after a stall (the rest are dropped)
+OVERRUN_REPORT_FREQUENCY = 10 # seconds between overrun reports (so we don't spam the logs)
+BROADCAST_REPORT_FREQUENCY = 300 # seconds between reports of how long broadcasts take to encode
+PHYSICS_ENGINE = False # Use the vectorized NumPy engine for movement and metabolism (server/models/physics.py)
+RESTORE_CATCH_UP_LIMIT = 3600 # most seconds of downtime we fast-forward after loading a snapshot (the rest is skipped)
+IDLE_MODE = True # Drop to a coarse tick when nobody is connected to /aquarium
+IDLE_TICK = 5 # seconds per (fast-forwarded) step in idle mode
+IDLE_POLL_FREQUENCY = 0.05 # seconds between checks for new commands (like a viewer connecting) in idle mode
+
+# Fixed-timestep scheduler for the simulation loop (on a monotonic clock)
+# The simulation always advances in steps of exactly `tick` seconds. Real time that passes is added to
+# an accumulator and we run as many steps as fit (up to `max_catch_up_steps` after a stall, like a
+# slow backup or Mongo call). Anything beyond that is dropped so we don't spiral trying to catch up.
+class TickScheduler():
+    def __init__(self, tick=SIMULATION_TICK, max_catch_up_steps=MAX_CATCH_UP_STEPS):
+        self.tick = tick
+        self.max_catch_up_steps = max_catch_up_steps
+        self.accumulator = 0.0 # seconds of real time we haven't simulated yet
+        self.last_time = time.perf_counter()
+
+        # Stats (reported every OVERRUN_REPORT_FREQUENCY seconds if there were overruns)
+        self.steps = 0 # total ticks simulated
+        self.overruns = 0 # loops that took longer than a tick
+        self.dropped_steps = 0 # ticks we gave up on after a stall
+        self.worst_loop_time = 0.0
+        self.last_report = self.last_time
+        self.overruns_at_last_report = 0
+        self.dropped_at_last_report = 0
+
+    def steps_due(self) -> int:
+        # How many fixed steps to simulate now
+        now = time.perf_counter()
+        self.accumulator += now - self.last_time
+        self.last_time = now
+        steps = int(self.accumulator // self.tick)
+        if steps > self.max_catch_up_steps:
+            dropped = steps - self.max_catch_up_steps
+            self.dropped_steps += dropped
+            self.accumulator -= dropped * self.tick
+            steps = self.max_catch_up_steps
+        self.accumulator -= steps * self.tick
+        self.steps += steps
+        return(steps)
+
+    def finish_loop(self, loop_start, aquarium):
+        # Record how long the loop took and report overruns
+        now = time.perf_counter()
+        loop_time = now - loop_start
+        if loop_time > self.tick:
+            self.overruns += 1
+            self.worst_loop_time = max(self.worst_loop_time, loop_time)
+        if (now - self.last_report) > OVERRUN_REPORT_FREQUENCY:
+            new_overruns = self.overruns - self.overruns_at_last_report
+            new_dropped = self.dropped_steps - self.dropped_at_last_report
+            if new_overruns or new_dropped:
+                print(f"⚠️ Simulation loop overran the {self.tick}s tick {new_overruns} times in the last "
+                      f"{now - self.last_report:.0f}s (worst {self.worst_loop_time:.3f}s, {new_dropped} ticks dropped, "
+                      f"{self.overruns} overruns total, {aquarium.activity})")
+            self.last_report = now
+            self.overruns_at_last_report = self.overruns
+            self.dropped_at_last_report = self.dropped_steps
+            self.worst_loop_time = 0.0
+
+    def reset(self):
+        # Start counting from now (after idle mode, so the time we spent idle isn't a stall)
+        self.accumulator = 0.0
+        self.last_time = time.perf_counter()
+
+    def time_until_next_step(self) -> float:
+        elapsed = time.perf_counter() - self.last_time
+        return(max(0, self.tick - self.accumulator - elapsed))
 
 # This is the main game/simulation loop
 # Either pass an existing aquarium or create a new one
 def aquarium_simulation(socketio, command_queue, user_manager, aquarium):
-    
-    last_loop = datetime.now(timezone.utc)
-    last_sync = datetime.now(timezone.utc)
-    last_backup = datetime.now(timezone.utc)
+
+    # If the aquarium was loaded from a snapshot, skip over the time the server was down in one go
+    # (otherwise everything that expired in the meantime goes on the first tick)
+    aquarium.catch_up(limit=RESTORE_CATCH_UP_LIMIT)
+
+    if PHYSICS_ENGINE:
+        aquarium.enable_physics_engine()
+
+    scheduler = TickScheduler()
+    broadcaster = Broadcaster(socketio)
+    delta_time = scheduler.tick # Every step is exactly one tick (in seconds)
+    last_backup = time.perf_counter()
+    last_broadcast_report = time.perf_counter()
+    viewers = {} # {sid: sync format} for the clients connected to /aquarium
+    # Idle mode: when nobody is watching we only fast-forward the aquarium every IDLE_TICK seconds
+    idle = False
+    last_idle_step = time.perf_counter()
 
     while True:
 
-        # Start a timer and calculate the time since the last loop
-        loop_start = datetime.now(timezone.utc)
-        delta_time = loop_start - last_loop
+        if idle:
+            # Only wake up for commands (like a viewer connecting) or the next coarse step
+            if command_queue.empty() and ((time.perf_counter() - last_idle_step) < IDLE_TICK):
+                time.sleep(IDLE_POLL_FREQUENCY)
+                continue
+        else:
+            # Wait until at least one tick is due
+            steps = scheduler.steps_due()
+            if steps == 0:
+                time.sleep(scheduler.time_until_next_step())
+                continue
+        loop_start = time.perf_counter()
 
         # Set a flag to indicate whether we should broadcast a sync (or update individual items)
         broadcast_sync = False
+        # Viewers that need catching up (just connected, resuming or changed format), they get it on their own:
+        # {sid: where they were in the broadcast stream (None for new viewers)}
+        joining = {}
         # broadcast_updates = [] -> moved to a property of the aquarium
         # Reset aquarium.broadcast_updates
         aquarium.broadcast_updates = []
@@ -38,76 +134,126 @@ def aquarium_simulation(socketio, command_queue, user_manager, aquarium):
             match command:
                 
                 case "create":
-                    # Create and add a new item to the aquarium (when something is purchased)
-                    object_name = data["object_name"]
-                    object_kwargs = data["object_kwargs"]
-                    object_properties = data["object_properties"]
-                    new_object = eval(f"{object_name}(aquarium, **object_kwargs)")
-                    for key, value in object_properties.items():
-                        setattr(new_object, key, value)
-                    aquarium.add_object(new_object) # This will also add it to aquarium.broadcast_updates
+                    # Create and add a new item to the aquarium (when something is purchased or spawned)
+                    # Classes are looked up by name in the Thing registry (see thing_classes in models/aquarium.py)
+                    new_object = aquarium.new_object(data["object_name"], data["object_kwargs"], data["object_properties"])
+                    if new_object is not None:
+                        aquarium.add_object(new_object) # This will also add it to aquarium.broadcast_updates
 
                 case "tap": 
                     #  Users are ensured to exist before data is sent to the queue! No need to check here :)
                     user = User.get_by_username(data["username"])
-                    aquarium.add_object(Tap(aquarium, data["x"], data["y"], user.username))
+                    aquarium.add_object(aquarium.new_object("Tap", kwargs={"x": data["x"], "y": data["y"], "username": user.username}))
 
                 case "pickup" | "click": # No functional difference between the two
                     # How do we deal with multiple users interacting with the same object?
                     if (data["thing_label"] in aquarium.objects):
                         user = user_manager.get_by_username(data["username"])
-                        aquarium.objects[data["thing_label"]].click(user)
+                        thing = aquarium.objects[data["thing_label"]]
+                        thing.wake() # In case it was asleep
+                        thing.click(user)
                         socketio.emit("update_user", user.summarize_public, namespace="/interactions")
-                        broadcast_sync = True # Can't broadcast an update for an item that no longer exists
+                        # Broadcast what the click did (if it removed the Thing, the removal is already in there)
+                        if thing.label in aquarium.objects:
+                            aquarium.broadcast_updates.append(thing.summarize)
 
                 case "use":
                     match data["tool"]:
                         case "flake_bottle":
-                            flakes = Flake(aquarium, data["x"], data["y"], username=data["username"])
+                            flakes = aquarium.new_object("Flake", kwargs={"x": data["x"], "y": data["y"], "username": data["username"]})
                             aquarium.add_object(flakes)
                         case "pellet_bottle":
-                            pellets = Pellet(aquarium, data["x"], data["y"], username=data["username"])
+                            pellets = aquarium.new_object("Pellet", kwargs={"x": data["x"], "y": data["y"], "username": data["username"]})
                             aquarium.add_object(pellets)
 
                 case "sync":
                     broadcast_sync = True
 
+                case "viewer_connected":
+                    viewers[data["sid"]] = data.get("format", "json")
+                    # Send the new client what it missed (or the current state of the aquarium)
+                    joining[data["sid"]] = data.get("position")
+
+                case "viewer_resume":
+                    if data["sid"] in viewers:
+                        joining[data["sid"]] = data["position"] # A client that noticed a gap in the stream
+
+                case "viewer_format":
+                    if data["sid"] in viewers:
+                        viewers[data["sid"]] = data["format"]
+                        joining[data["sid"]] = None # The current state of the aquarium in the format they asked for
+
+                case "viewer_disconnected":
+                    viewers.pop(data["sid"], None)
+                    joining.pop(data["sid"], None)
+
                 case _:
-                    Warning(f"Unknown command {command}")
-
-        # Update the actual aquarium itself!
-        aquarium.update(delta_time)
-
-        # Update all Things in the aquarium
-        things_to_iterate = list(aquarium.objects.values()) # Prevent the dict from changing size during iteration
-        for thing in things_to_iterate:
-            thing.update(delta_time)
-            changed = thing.updated_this_loop
-            if changed:
-                aquarium.broadcast_updates.append(thing.summarize)
+                    print(f"Unknown command {command}")
+
+        if idle:
+            # Skip ahead to now (every IDLE_TICK seconds, or right away if someone just connected)
+            if ((loop_start - last_idle_step) >= IDLE_TICK) or viewers:
+                last_idle_step = loop_start
+                aquarium.fast_forward(max(0, time.time() * 1000 - aquarium.now) / 1000)
+            if viewers:
+                # Back to the full-fidelity loop
+                print(f"Leaving idle mode ({aquarium.activity})")
+                idle = False
+                scheduler.reset()
+                steps = 0 # We're already caught up
+                broadcast_sync = True
+            else:
+                if (loop_start - last_backup) > BACKUP_FREQUENCY:
+                    last_backup = loop_start
+                    aquarium.save()
+                    print(f"Backup saved at {datetime.now(timezone.utc)} ({aquarium.activity}, idle)")
+                continue # Nobody to broadcast to
+        elif IDLE_MODE and not viewers:
+            print(f"Nobody is watching, entering idle mode ({aquarium.activity})")
+            idle = True
+            last_idle_step = loop_start
+            scheduler.finish_loop(loop_start, aquarium)
+            continue
+
+        # Run the fixed steps that are due (more than one if we're catching up after a stall)
+        for _ in range(steps):
+
+            # Update the actual aquarium itself!
+            aquarium.update(delta_time)
+
+            # Update all Things in the aquarium that are awake (sleeping Things are at rest, see Thing.sleep)
+            things_to_iterate = list(aquarium.awake.values()) # Prevent the dict from changing size during iteration
+            for thing in things_to_iterate:
+                thing.update(delta_time)
+                # Only if something changed that the clients can't work out on their own
+                if thing.should_broadcast():
+                    aquarium.broadcast_updates.append(thing.summarize)
             
-        # Every few seconds (SYNC_FREQUENCY), sync the current state of the aquarium to with all clients
+        # Every so often (a keyframe, see Broadcaster.keyframe_due), sync the current state of the aquarium to with all clients
         # Or if a broadcast_sync flag is set
-        if ((loop_start - last_sync).total_seconds() > SYNC_FREQUENCY) or broadcast_sync:
-            last_sync = loop_start
-            socketio.emit("sync_everything", [thing.summarize for thing in aquarium.objects.values()], namespace="/aquarium")
+        if broadcaster.keyframe_due(aquarium) or broadcast_sync:
+            broadcaster.sync_everything(aquarium, scheduler.steps, formats=set(viewers.values()))
         
-        # Broadcast individual updates for Things that require it
+        # Broadcast updates for Things that require it (in one message, see server/broadcast.py)
         # No need to do it if we're already syncing everything
         else:
-            for summarized_update in aquarium.broadcast_updates:
-                socketio.emit("update_thing", summarized_update, namespace="/aquarium")
+            broadcaster.send_updates(aquarium.broadcast_updates, scheduler.steps)
+            # Everyone else is up to date, so catch up the viewers that need it one by one: the updates they missed
+            # if we still have them, otherwise a snapshot (shared by everyone joining this tick)
+            # (after the updates, so it's at least as new as anything they got from the room)
+            for sid, position in joining.items():
+                broadcaster.resume(aquarium, sid, scheduler.steps, viewers[sid], position)
+
+        if (loop_start - last_broadcast_report) > BROADCAST_REPORT_FREQUENCY:
+            last_broadcast_report = loop_start
+            print(f"Broadcasts: {broadcaster.report()}")
 
         # Every few minutes (BACKUP_FREQUENCY), save the current state of the aquarium
-        if (loop_start - last_backup).total_seconds() > BACKUP_FREQUENCY:
+        if (loop_start - last_backup) > BACKUP_FREQUENCY:
             last_backup = loop_start
             aquarium.save()
-            print(f"Backup saved at {last_backup}")
-
-        # Calculate the time it took to run the loop and wait for the next tick
-        loop_end = datetime.now(timezone.utc)
-        last_loop = loop_end
-        loop_time = (loop_end - loop_start).total_seconds()
-        if loop_time > SIMULATION_TICK:
-            Warning(f"Loop took {loop_time} seconds, which is longer than the tick time of {SIMULATION_TICK} seconds")
-        time.sleep(max(0, SIMULATION_TICK - loop_time))
+            print(f"Backup saved at {datetime.now(timezone.utc)} ({aquarium.activity})")
+
+        # Keep track of overruns then wait for the next tick
+        scheduler.finish_loop(loop_start, aquarium)
+        time.sleep(scheduler.time_until_next_step())
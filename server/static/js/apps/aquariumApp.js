@@ -1,8 +1,9 @@
-import { socket, aquariumSocket, interactionsSocket } from "../sockets.js";
+import { socket, aquariumSocket, aquariumStream, interactionsSocket } from "../sockets.js";
 import { Aquarium } from "../models/gameModels.js";
 import { thisUser, userManager } from "../models/userModels.js";
 import { Tool, CursorContainer } from "../models/interactionModels.js";
 import { animateCursor } from "../utils.js";
+import { unpackThings } from "../packed.js";
 
 const app = new PIXI.Application();
 await app.init({ 
@@ -131,8 +132,36 @@ resize();
 //////////////////////////////
 
 // Register event listeners for the aquarium socket
-aquariumSocket.on("sync_everything", aquarium.syncEverything);
-aquariumSocket.on("update_thing", aquarium.updateThing);
+let resuming = false; // Whether we've asked the server for the updates we missed
+aquariumSocket.on("connect", () => { resuming = false; }); // The server catches us up when we reconnect
+aquariumSocket.on("sync_everything", (data, position) => {
+  aquarium.syncEverything(unpackThings(data));
+  // Keyframes and snapshots put us at a new place in the stream (check /docs/socketio.md)
+  if (position) {
+    aquariumStream.stream = position.stream;
+    aquariumStream.seq = position.seq;
+    resuming = false;
+  }
+});
+aquariumSocket.on("update_thing", (thingData) => aquarium.updateThing(thingData));
+aquariumSocket.on("update_things", (batch) => {
+  // Numbered updates only work in order, so if we missed some ask for them (and skip the rest until they come)
+  if ((batch.seq !== undefined) && (aquariumStream.seq !== null)) {
+    if (batch.seq <= aquariumStream.seq) {
+      return; // Already got it
+    }
+    if (batch.seq > aquariumStream.seq + 1) {
+      if (!resuming) {
+        resuming = true;
+        aquariumSocket.emit("resume", { stream: aquariumStream.stream, seq: aquariumStream.seq });
+      }
+      return;
+    }
+    aquariumStream.seq = batch.seq;
+    resuming = false;
+  }
+  aquarium.updateThings(batch);
+});
 
 //////////////////////////////
 // Add clicking event handlers
@@ -224,6 +253,13 @@ for (let eventName of cursorEveents) {
     cursorContainer.updateCursor(data, eventName);
   });
 }
+// The server sends cursor positions in batches (the latest one of everyone who moved, a few times a second)
+interactionsSocket.on("cursors", (batch) => {
+  for (let data of batch.cursors) {
+    if (data.username === thisUser.username) { continue; }
+    cursorContainer.updateCursor(data, "cursor");
+  }
+});
 
 //////////////////
 // Debugging stuff
@@ -1,4 +1,5 @@
 import { socket, aquariumSocket } from "./sockets.js";
+import { unpackThings } from "./packed.js";
 
 class FishInfo {
     constructor(fishInfo) {
@@ -40,7 +41,8 @@ class FishInfo {
 }
 
 // Add a listener for the "sync_everything" event
-aquariumSocket.on("sync_everything", (listOfFish) => {
+aquariumSocket.on("sync_everything", (data) => {
+    const listOfFish = unpackThings(data);
     // Clear the fish list
     $("#fish-info-container").empty();
     // Add each fish to the list
@@ -24,6 +24,10 @@ class Aquarium extends PIXI.Container {
         this.removeThing = this.removeThing.bind(this);
         this.syncEverything = this.syncEverything.bind(this);
         this.updateThing = this.updateThing.bind(this);
+        this.updateThings = this.updateThings.bind(this);
+
+        // Number of the last simulation tick we got updates for (from update_things)
+        this.lastTick = null;
     }
 
     insideAquariumObject(object) {
@@ -73,12 +77,22 @@ class Aquarium extends PIXI.Container {
             if (!serverThingLabels.includes(thingLabel)) { this.removeThing(thingLabel);}
         }
         // Add new things / update existing things
+        // Every record is a whole Thing, so it replaces what we have whatever its version (we may have versions
+        // from before the server restarted, or from a stream we fell behind on)
         for (let thingData of listOfThings) {
+            this.updateThing(thingData, true);
+        }
+    }
+
+    updateThings(batch) {
+        // Every Thing that changed in one simulation tick (only the latest summary of each)
+        this.lastTick = batch.tick;
+        for (let thingData of batch.things) {
             this.updateThing(thingData);
         }
     }
 
-    updateThing(thingData) {
+    updateThing(thingData, replace = false) {
         // Remove things if .remove is true
         if (thingData.remove) {
             this.removeThing(thingData.label);
@@ -86,10 +100,16 @@ class Aquarium extends PIXI.Container {
         }
         let thing = this.children.find(t => t.label === thingData.label);
         if (thing) {
+            // Updates only have the fields that changed, and a version so we can skip old ones
+            if (!replace && (thingData.version !== undefined) && (thingData.version <= thing.version)) {
+                return;
+            }
             thing.serverUpdate(thingData);
-        } else {
+        } else if (thingData.class_hierarchy !== undefined) {
+            // The first time we see a Thing we get all of it
             this.addThing(thingData);
         }
+        // Otherwise it's an update for a Thing we haven't seen yet (we just connected), the sync will have it
     }
 }
 
@@ -156,9 +176,13 @@ class Thing extends PIXI.AnimatedSprite {
             this[key] = thingInput[key];
         }
         // Also server_x, server_y, should just be the x, y from the server
-        // This is the only exception, I think?
-        this.server_x = thingInput.x;
-        this.server_y = thingInput.y;
+        // This is the only exception, I think? (updates leave them out if they didn't change)
+        if (thingInput.x !== undefined) {
+            this.server_x = thingInput.x;
+        }
+        if (thingInput.y !== undefined) {
+            this.server_y = thingInput.y;
+        }
         // Also keep track of the last time the server updated this thing
         this.local_update_time = Date.now(); // IMPORTANT BECAUSE CLOCKS AREN'T SYNCHRONIZED
     }
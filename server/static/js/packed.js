@@ -0,0 +1,99 @@
+import { aquariumSocket, aquariumStream } from "./sockets.js";
+
+// Ask the server for sync_everything in the binary "packed" format (check /docs/socketio.md)
+// The server sends the schema (sync_schema) first, then every sync_everything is an ArrayBuffer
+const PACKED_SYNC = true;
+
+const FIELD_SIZES = { f: 4, d: 8 };
+let schema = null;
+let lastBuffer = null; // Every sync_everything listener gets the same buffer, so only decode it once
+let lastThings = null;
+
+// We ask when we connect (rooms are reset when we reconnect, so it's in the auth we send every time)
+if (PACKED_SYNC) {
+    aquariumStream.format = "packed";
+}
+
+aquariumSocket.on("sync_schema", (newSchema) => {
+    // Work out where each field is in a record once
+    let offset = 0;
+    const numbers = newSchema.numbers.map(([name, code]) => {
+        const field = { name, code, offset };
+        offset += FIELD_SIZES[code];
+        return field;
+    });
+    const strings = newSchema.strings.map(([name, kind]) => {
+        const field = { name, kind, offset };
+        offset += 2;
+        return field;
+    });
+    schema = { ...newSchema, numbers, strings };
+});
+
+// Turn a sync_everything payload into a list of Thing summaries (JSON payloads are already one)
+function unpackThings(data) {
+    if (Array.isArray(data)) {
+        return data;
+    }
+    if (data === lastBuffer) {
+        return lastThings;
+    }
+    const view = new DataView(data);
+    const decoder = new TextDecoder();
+    if (decoder.decode(new Uint8Array(data, 0, 3)) !== "AQP" || view.getUint8(3) !== schema.version) {
+        console.log("Unknown packed sync_everything format");
+        return [];
+    }
+    const stringCount = view.getUint32(4, true);
+    const recordCount = view.getUint32(8, true);
+
+    // String table
+    let offset = 12;
+    const strings = [];
+    for (let i = 0; i < stringCount; i++) {
+        const length = view.getUint32(offset, true);
+        strings.push(decoder.decode(new Uint8Array(data, offset + 4, length)));
+        offset += 4 + length;
+    }
+    const parsed = new Map(); // JSON strings we've already parsed (class hierarchies repeat a lot)
+    const parseJSON = (index) => {
+        if (!parsed.has(index)) {
+            parsed.set(index, JSON.parse(strings[index]));
+        }
+        return parsed.get(index);
+    };
+
+    // Records
+    const things = [];
+    for (let i = 0; i < recordCount; i++) {
+        const start = offset + i * schema.record_size;
+        const thing = {};
+        for (let field of schema.numbers) {
+            const value = (field.code === "d") ? view.getFloat64(start + field.offset, true) : view.getFloat32(start + field.offset, true);
+            if (!Number.isNaN(value)) {
+                thing[field.name] = value;
+            }
+        }
+        for (let field of schema.strings) {
+            const index = view.getUint16(start + field.offset, true);
+            if (index === schema.absent) {
+                continue;
+            } else if (index === schema.null) {
+                thing[field.name] = null;
+            } else if (field.name === "extra") {
+                Object.assign(thing, parseJSON(index));
+            } else if (field.kind === "json") {
+                // Copy it, Things change their class_hierarchy (addThing reverses it)
+                thing[field.name] = structuredClone(parseJSON(index));
+            } else {
+                thing[field.name] = strings[index];
+            }
+        }
+        things.push(thing);
+    }
+    lastBuffer = data;
+    lastThings = things;
+    return things;
+}
+
+export { unpackThings };
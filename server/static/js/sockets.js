@@ -3,7 +3,10 @@ import { io } from "https://cdn.socket.io/4.8.0/socket.io.esm.min.js";
 const socket = io();
 const usersSocket = io("/users");
 const chatSocket = io("/chat");
-const aquariumSocket = io("/aquarium"); 
+// Where we are in the aquarium's stream of updates (and the sync_everything format we want), sent every time
+// we (re)connect so the server only has to send us what we missed (check /docs/socketio.md)
+const aquariumStream = { stream: null, seq: null, format: "json" };
+const aquariumSocket = io("/aquarium", { auth: (cb) => cb(aquariumStream) });
 const interactionsSocket = io("/interactions");
 const storeSocket = io("/store");
 
@@ -14,4 +17,4 @@ aquariumSocket.on("connect", () => { console.log("Connected to the aquarium name
 interactionsSocket.on("connect", () => { console.log("Connected to the interactions namespace!"); });
 storeSocket.on("connect", () => { console.log("Connected to the store namespace!"); });
 
-export { socket, usersSocket, chatSocket, aquariumSocket, interactionsSocket, storeSocket };
\ No newline at end of file
+export { socket, usersSocket, chatSocket, aquariumSocket, aquariumStream, interactionsSocket, storeSocket };
\ No newline at end of file
@@ -0,0 +1,83 @@
+import sys, os
+sys.path.insert(0, os.getcwd())
+
+import queue, random, time
+from server.broadcast import Broadcaster, WireJSON
+from server.models.aquarium import Aquarium
+from server.models.fish import Guppy
+from server.models.user import UserManager
+import server.models.things
+
+# Compare the ways we can broadcast what changed every tick (see server/broadcast.py)
+# Guppies chase a steady stream of flakes (feeding fish change every tick) with a sync_everything every
+# second, and a fake Socket.IO server encodes every message like the real one would (a JSON packet each)
+# so we can count the bytes each client gets.
+# Run from the repository root: python tools/benchmark_broadcast.py
+
+FISH_COUNT = 200
+TICKS = 200 # 10 seconds of simulation
+SIMULATION_TICK = 0.05
+SYNC_EVERY = 20 # ticks (KEYFRAME_MIN_INTERVAL in server/broadcast.py)
+MODES = {
+    "per thing": {"batch_updates": False, "encode_once": False},
+    "batched": {"delta_updates": False, "encode_once": False},
+    "deltas": {"encode_once": False},
+    "encode once": {},
+}
+
+class EncodingSocketIO():
+    # Stands in for flask_socketio.SocketIO: just encodes each message into a Socket.IO packet
+    def __init__(self):
+        self.packets = 0
+        self.bytes = 0
+        self.encode_time = 0
+
+    def emit(self, event, *args, namespace=None):
+        start = time.perf_counter()
+        packet = f"42{namespace},{WireJSON.dumps([event, *args], separators=(',', ':'))}"
+        self.encode_time += time.perf_counter() - start
+        self.packets += 1
+        self.bytes += len(packet)
+
+def run():
+    random.seed(0)
+    aquarium = Aquarium(command_queue=queue.Queue(), user_manager=UserManager())
+    for _ in range(FISH_COUNT):
+        fish = Guppy(aquarium)
+        fish.x, fish.y = fish._get_random_xy()
+        fish.hunger = 0.5
+        aquarium.add_object(fish)
+    # Every mode sees exactly the same ticks
+    broadcasters = {name: Broadcaster(EncodingSocketIO(), **kwargs) for name, kwargs in MODES.items()}
+    updates_sent = 0
+    broadcast_time = {name: 0 for name in broadcasters}
+    for tick in range(TICKS):
+        aquarium.broadcast_updates = []
+        if tick % 2 == 0:
+            aquarium.add_object(aquarium.new_object("Flake", kwargs={"x": random.uniform(0, 900), "y": random.uniform(0, 200)}))
+        # Aquarium.update on a simulated clock (the clients' clock moves with the simulation here)
+        aquarium.now += SIMULATION_TICK * 1000
+        aquarium.pool.recycle()
+        aquarium.timers.run_due(aquarium.now, aquarium.objects)
+        for thing in list(aquarium.awake.values()):
+            thing.update(SIMULATION_TICK)
+            if thing.should_broadcast():
+                aquarium.broadcast_updates.append(thing.summarize)
+        updates_sent += len(aquarium.broadcast_updates)
+        for name, broadcaster in broadcasters.items():
+            start = time.perf_counter()
+            if tick % SYNC_EVERY == 0:
+                broadcaster.sync_everything(aquarium, tick)
+            else:
+                broadcaster.send_updates(aquarium.broadcast_updates, tick)
+            broadcast_time[name] += time.perf_counter() - start
+
+    seconds = TICKS * SIMULATION_TICK
+    print(f"{FISH_COUNT} fish, {len(aquarium.objects)} objects, {updates_sent / TICKS:.1f} updates per tick on average "
+          f"({updates_sent / seconds / FISH_COUNT:.1f} per fish per second)")
+    for name, broadcaster in broadcasters.items():
+        socketio = broadcaster.socketio
+        print(f"{name:11} | {socketio.packets / seconds:7.1f} packets/s | {socketio.bytes / seconds / 1024:7.1f} KiB/s per client | "
+              f"{socketio.encode_time / TICKS * 1e3:6.3f} ms encoding, {broadcast_time[name] / TICKS * 1e3:6.3f} ms total per tick")
+
+run()
@@ -0,0 +1,57 @@
+import sys, os
+sys.path.insert(0, os.getcwd())
+
+import json, random
+from server.events.interactions import CursorAggregator, CURSOR_FLUSH_FREQUENCY
+
+# USERS clients move their mouse at MOUSE_RATE events a second for SECONDS (one of them floods at FLOOD_RATE).
+# Compares rebroadcasting every cursor event with CursorAggregator's batches (see server/events/interactions.py),
+# counting the packets and bytes every client receives.
+# Run from the repository root: python tools/benchmark_cursors.py
+
+USERS = 50
+MOUSE_RATE = 60 # events per second (browsers fire mousemove about once a frame)
+FLOOD_RATE = 500 # events per second from one misbehaving client
+SECONDS = 10
+
+class CountingSocketIO():
+    # Stands in for flask_socketio.SocketIO: counts what every client connected to /interactions receives
+    def __init__(self):
+        self.packets = 0
+        self.bytes = 0
+
+    def emit(self, event, data, namespace=None):
+        self.packets += USERS
+        self.bytes += len(f"42{namespace},{json.dumps([event, data])}") * USERS
+
+def events():
+    # (time, cursor event) for everyone, in order
+    random.seed(0)
+    timeline = []
+    for user in range(USERS):
+        rate = FLOOD_RATE if (user == 0) else MOUSE_RATE
+        for i in range(SECONDS * rate):
+            when = i / rate + random.uniform(0, 1 / rate)
+            timeline.append((when, {"username": f"user{user}", "x": random.uniform(0, 1000), "y": random.uniform(0, 1000), "timestamp": when * 1000}))
+    timeline.sort(key=lambda event: event[0])
+    return(timeline)
+
+timeline = events()
+
+# Every event rebroadcast to everyone
+socketio = CountingSocketIO()
+for _, data in timeline:
+    socketio.emit("cursor", data, namespace="/interactions")
+print(f"rebroadcast | {socketio.packets / SECONDS:9.0f} packets/s | {socketio.bytes / SECONDS / 1024:8.1f} KiB/s to {USERS} clients")
+
+# Batched
+socketio = CountingSocketIO()
+cursors = CursorAggregator(socketio)
+next_flush = 1 / CURSOR_FLUSH_FREQUENCY
+for when, data in timeline:
+    while when >= next_flush:
+        cursors.flush()
+        next_flush += 1 / CURSOR_FLUSH_FREQUENCY
+    cursors.add(data, now=when)
+cursors.flush()
+print(f"batched     | {socketio.packets / SECONDS:9.0f} packets/s | {socketio.bytes / SECONDS / 1024:8.1f} KiB/s to {USERS} clients | {cursors.report()}")
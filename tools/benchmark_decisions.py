@@ -0,0 +1,73 @@
+import sys, os
+sys.path.insert(0, os.getcwd())
+
+import queue, random, time
+from server.models.aquarium import Aquarium
+from server.models.fish import Guppy
+from server.models.user import UserManager
+import server.models.things
+
+# Compare deciding every tick (decision_interval = 0, the old policy) against staggered decisions
+# Runs a quiet tank of guppies, then one where a flake drops every few ticks (a feeding frenzy, where
+# lots of events make fish decide early), and measures the time per tick, how many times _choose_state
+# ran, and how quickly the flakes get eaten.
+# Run from the repository root: python tools/benchmark_decisions.py
+
+FISH_COUNT = 200
+TICKS = 600 # 30 seconds of simulation
+FLAKE_EVERY = [None, 5] # ticks (None for no food)
+SIMULATION_TICK = 0.05
+INTERVALS = [0, 0.1, 0.25, 0.5]
+
+def run(decision_interval, flake_every):
+    random.seed(0)
+    Guppy.decision_interval = decision_interval
+    aquarium = Aquarium(command_queue=queue.Queue(), user_manager=UserManager())
+    for _ in range(FISH_COUNT):
+        fish = Guppy(aquarium)
+        fish.x, fish.y = fish._get_random_xy()
+        fish.hunger = 0.5 # Hungry enough for flakes (but not for each other)
+        aquarium.add_object(fish)
+
+    # Count decisions and record when each flake gets eaten
+    decisions = [0]
+    choose_state = Guppy._choose_state
+    def counting_choose_state(fish):
+        decisions[0] += 1
+        choose_state(fish)
+    Guppy._choose_state = counting_choose_state
+    spawned = {} # {label: tick}
+    eaten_after = [] # ticks
+    tick = [0]
+    remove_object = aquarium.remove_object
+    def recording_remove_object(object):
+        if object.label in spawned:
+            eaten_after.append(tick[0] - spawned.pop(object.label))
+        remove_object(object)
+    aquarium.remove_object = recording_remove_object
+
+    elapsed = 0
+    for tick[0] in range(TICKS):
+        if flake_every and (tick[0] % flake_every == 0):
+            flake = aquarium.new_object("Flake", kwargs={"x": random.uniform(0, 900), "y": random.uniform(0, 200)})
+            aquarium.add_object(flake)
+            spawned[flake.label] = tick[0]
+        start = time.perf_counter()
+        aquarium.update(SIMULATION_TICK)
+        for thing in list(aquarium.awake.values()):
+            thing.update(SIMULATION_TICK)
+        elapsed += time.perf_counter() - start
+        aquarium.broadcast_updates = []
+    Guppy._choose_state = choose_state
+
+    if eaten_after:
+        eaten = f"{len(eaten_after):3} flakes eaten, {sum(eaten_after) / len(eaten_after) * SIMULATION_TICK:5.2f}s on average"
+    else:
+        eaten = "no flakes eaten"
+    print(f"{'no food' if flake_every is None else f'flake every {flake_every} ticks'} | "
+          f"interval {decision_interval:4.2f}s | {elapsed / TICKS * 1e3:6.2f} ms/tick | "
+          f"{decisions[0] / (TICKS * FISH_COUNT):5.2f} decisions/fish/tick | {eaten}")
+
+for flake_every in FLAKE_EVERY:
+    for decision_interval in INTERVALS:
+        run(decision_interval, flake_every)
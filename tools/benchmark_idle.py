@@ -0,0 +1,68 @@
+import sys, os
+sys.path.insert(0, os.getcwd())
+
+import queue, random, time
+from server.models.aquarium import Aquarium
+from server.models.fish import Guppy, Angelfish
+from server.models.user import UserManager
+import server.models.things
+
+# Compare running an empty-room aquarium at the full tick against idle mode (Aquarium.fast_forward
+# every IDLE_TICK seconds, see simulate.py). Reports the CPU time per simulated minute and how far
+# the fish's hunger and health drift from the full-fidelity run.
+# Run from the repository root: python tools/benchmark_idle.py
+
+FISH_COUNT = 50
+SIMULATED_SECONDS = 600
+SIMULATION_TICK = 0.05
+IDLE_TICK = 5
+
+def build():
+    random.seed(0)
+    aquarium = Aquarium(command_queue=queue.Queue(), user_manager=UserManager())
+    for i in range(FISH_COUNT):
+        fish = (Guppy if i % 2 else Angelfish)(aquarium)
+        fish.x, fish.y = fish._get_random_xy()
+        fish.hunger, fish.health = random.uniform(0, 0.5), random.uniform(0.5, 1)
+        aquarium.add_object(fish)
+    aquarium.add_object(aquarium.new_object("TreasureChest", kwargs={"x": 400, "y": 400}))
+    return(aquarium)
+
+def drain(aquarium):
+    # What simulate.py does with the command queue (coins, skeletons)
+    while not aquarium.command_queue.empty():
+        _, data = aquarium.command_queue.get()
+        new_object = aquarium.new_object(data["object_name"], data["object_kwargs"], data["object_properties"])
+        if new_object is not None:
+            aquarium.add_object(new_object)
+
+def full_tick(aquarium):
+    # Aquarium.update on a simulated clock
+    aquarium.now += SIMULATION_TICK * 1000
+    aquarium.pool.recycle()
+    aquarium.timers.run_due(aquarium.now, aquarium.objects)
+    for thing in list(aquarium.awake.values()):
+        thing.update(SIMULATION_TICK)
+    drain(aquarium)
+
+def idle_tick(aquarium):
+    aquarium.fast_forward(IDLE_TICK)
+    drain(aquarium)
+
+def run(name, step, seconds_per_step):
+    aquarium = build()
+    start = time.perf_counter()
+    for _ in range(round(SIMULATED_SECONDS / seconds_per_step)):
+        step(aquarium)
+    elapsed = time.perf_counter() - start
+    fish = {label: (fish.hunger, fish.health) for label, fish in aquarium.objects_by_class.get("Fish", {}).items()}
+    print(f"{name:5} | {elapsed / SIMULATED_SECONDS * 60 * 1e3:8.2f} ms of CPU per simulated minute | "
+          f"{len(aquarium.objects)} objects at the end")
+    return(fish)
+
+full = run("full", full_tick, SIMULATION_TICK)
+idle = run("idle", idle_tick, IDLE_TICK)
+shared = full.keys() & idle.keys()
+print(f"Largest difference over {len(shared)} fish: "
+      f"hunger {max(abs(full[label][0] - idle[label][0]) for label in shared):.2e}, "
+      f"health {max(abs(full[label][1] - idle[label][1]) for label in shared):.2e}")
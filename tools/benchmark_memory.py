@@ -0,0 +1,56 @@
+import sys, os
+sys.path.insert(0, os.getcwd())
+
+import queue, random, tracemalloc
+from server.models.aquarium import Aquarium, CLASS_CONSTANTS, thing_classes
+from server.models.things import Flake, Pellet, Coin, Bubble, Tap
+from server.models.user import UserManager
+
+# Measure how much memory the small, short-lived Things take once they're in an Aquarium
+# "slots" is the classes as they are. "dict" is the baseline: the same classes with a __dict__ and the
+# per-class constants (CLASS_CONSTANTS) copied onto every instance, the way Things used to store them.
+# Run from the repository root: python tools/benchmark_memory.py
+
+OBJECT_COUNT = 10000
+CLASSES = {"Flake": Flake, "Pellet": Pellet, "Coin": Coin, "Bubble": Bubble, "Tap": Tap}
+
+def with_dict(cls):
+    # A subclass without __slots__ (so it has a __dict__) that keeps its own copy of every class constant
+    def __init__(self, *args, **kwargs):
+        cls.__init__(self, *args, **kwargs)
+        for name in CLASS_CONSTANTS:
+            if hasattr(cls, name):
+                value = getattr(cls, name)
+                self.__dict__[name] = list(value) if isinstance(value, list) else value
+    registered = thing_classes[cls.__name__]
+    subclass = type(cls.__name__, (cls,), {"__init__": __init__})
+    thing_classes[cls.__name__] = registered # Subclassing registers it, put the real one back
+    return(subclass)
+
+def make_object(aquarium, thing_class):
+    x, y = random.uniform(0, aquarium.width), random.uniform(0, aquarium.height)
+    if issubclass(thing_class, Tap):
+        return(thing_class(aquarium, x=x, y=y, username="benchmark"))
+    return(thing_class(aquarium, x=x, y=y))
+
+def benchmark(name, thing_class):
+    random.seed(0)
+    aquarium = Aquarium(command_queue=queue.Queue(), user_manager=UserManager())
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    for _ in range(OBJECT_COUNT):
+        aquarium.add_object(make_object(aquarium, thing_class))
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    return(sum(stat.size_diff for stat in after.compare_to(before, "filename")))
+
+totals = {"dict": 0, "slots": 0}
+for name, thing_class in CLASSES.items():
+    baseline = benchmark(name, with_dict(thing_class))
+    current = benchmark(name, thing_class)
+    totals["dict"] += baseline
+    totals["slots"] += current
+    print(f"{name:>7} x {OBJECT_COUNT} | dict {baseline / OBJECT_COUNT:6.0f} bytes/object | "
+          f"slots {current / OBJECT_COUNT:6.0f} bytes/object")
+print(f"  total | dict {totals['dict'] / 2**20:6.2f} MiB | slots {totals['slots'] / 2**20:6.2f} MiB "
+      f"({1 - totals['slots'] / totals['dict']:.0%} less)")
@@ -0,0 +1,45 @@
+import sys, os
+sys.path.insert(0, os.getcwd())
+
+import json, queue, random, time
+from server.broadcast import pack_things
+from server.models.aquarium import Aquarium
+from server.models.fish import Guppy, Angelfish, Clownfish
+from server.models.user import UserManager
+import server.models.things
+
+# Compare the JSON and packed (binary) sync_everything payloads on a 500 object tank (see server/broadcast.py)
+# Run from the repository root: python tools/benchmark_packed.py
+
+REPEATS = 50
+TANK = {"Fish": 150, "Flake": 150, "Coin": 100, "Bubble": 80, "Tap": 15, "TreasureChest": 5}
+
+def build():
+    random.seed(0)
+    aquarium = Aquarium(command_queue=queue.Queue(), user_manager=UserManager())
+    for i in range(TANK["Fish"]):
+        fish = random.choice([Guppy, Angelfish, Clownfish])(aquarium)
+        fish.x, fish.y = fish._get_random_xy()
+        for _ in range(random.randint(0, 5)):
+            fish._add_relationship(f"user{random.randint(0, 50)}", random.random())
+        aquarium.add_object(fish)
+    for class_name in ["Flake", "Coin", "Bubble", "TreasureChest"]:
+        for _ in range(TANK[class_name]):
+            aquarium.add_object(aquarium.new_object(class_name, kwargs={"x": random.uniform(0, 900), "y": random.uniform(0, 500)}))
+    for _ in range(TANK["Tap"]):
+        aquarium.add_object(aquarium.new_object("Tap", kwargs={"x": random.uniform(0, 900), "y": random.uniform(0, 500), "username": f"user{random.randint(0, 50)}"}))
+    return(aquarium)
+
+def measure(name, encode, things):
+    payload = encode(things)
+    start = time.perf_counter()
+    for _ in range(REPEATS):
+        encode(things)
+    elapsed = (time.perf_counter() - start) / REPEATS
+    print(f"{name:6} | {len(payload) / 1024:7.1f} KiB | {elapsed * 1e3:6.2f} ms to encode")
+
+aquarium = build()
+things = [thing.summarize for thing in aquarium.objects.values()]
+print(f"{len(things)} objects")
+measure("json", lambda things: json.dumps(things).encode("utf-8"), things)
+measure("packed", pack_things, things)
@@ -0,0 +1,64 @@
+import sys, os
+sys.path.insert(0, os.getcwd())
+
+import queue, random, time
+from server.models.aquarium import Aquarium
+from server.models.fish import Guppy
+from server.models.user import UserManager
+
+# Compare scalar (per-object Python) movement and metabolism against the vectorized physics engine
+# The engine tick goes through Aquarium.update, so it includes re-indexing the Things that changed cells.
+# Exits with an error if the engine misses ENGINE_BUDGET or MIN_SPEEDUP at the largest fish count (so a
+# slowdown like per-move neighbor queries shows up).
+# Run from the repository root: python tools/benchmark_physics.py
+
+FISH_COUNTS = [100, 1000, 5000]
+TICKS = 50
+SIMULATION_TICK = 0.05
+ENGINE_BUDGET = 0.010 # Seconds per tick for the engine at FISH_COUNTS[-1] (it takes about 4 ms)
+MIN_SPEEDUP = 5
+
+def build_aquarium(n_fish, engine):
+    random.seed(0)
+    aquarium = Aquarium(command_queue=queue.Queue(), user_manager=UserManager())
+    if engine:
+        aquarium.enable_physics_engine()
+    for _ in range(n_fish):
+        fish = Guppy(aquarium)
+        fish.x, fish.y = fish._get_random_xy()
+        fish.destination_x, fish.destination_y = fish._get_random_xy()
+        fish.speed = random.uniform(fish.max_speed/4, fish.max_speed/2)
+        aquarium.add_object(fish)
+    return(aquarium)
+
+def scalar_tick(aquarium, delta_time):
+    for fish in list(aquarium.objects.values()):
+        fish._calculate_health(delta_time)
+        fish._calculate_hunger(delta_time)
+        fish._calculate_coin_drop(delta_time)
+        fish._move_toward_destination(delta_time)
+
+def engine_tick(aquarium, delta_time):
+    aquarium.update(delta_time)
+
+def benchmark(n_fish):
+    delta_time = SIMULATION_TICK
+    results = {}
+    for name, engine, tick in [("scalar", False, scalar_tick), ("engine", True, engine_tick)]:
+        aquarium = build_aquarium(n_fish, engine)
+        start = time.perf_counter()
+        for _ in range(TICKS):
+            tick(aquarium, delta_time)
+        results[name] = (time.perf_counter() - start) / TICKS
+    print(f"{n_fish:>5} fish | scalar {results['scalar'] * 1e3:7.2f} ms/tick | "
+          f"engine {results['engine'] * 1e3:6.2f} ms/tick | speedup {results['scalar'] / results['engine']:5.1f}x "
+          f"(tick budget {SIMULATION_TICK * 1e3:.0f} ms)")
+    return(results)
+
+for n_fish in FISH_COUNTS:
+    results = benchmark(n_fish)
+speedup = results["scalar"] / results["engine"]
+if (results["engine"] > ENGINE_BUDGET) or (speedup < MIN_SPEEDUP):
+    print(f"Engine regression: {results['engine'] * 1e3:.2f} ms/tick and {speedup:.1f}x at {FISH_COUNTS[-1]} fish "
+          f"(expected under {ENGINE_BUDGET * 1e3:.0f} ms and at least {MIN_SPEEDUP}x)")
+    sys.exit(1)
@@ -0,0 +1,53 @@
+import sys, os
+sys.path.insert(0, os.getcwd())
+
+import gc, queue, random, time, uuid
+from server.models.aquarium import Aquarium
+from server.models.user import UserManager
+import server.models.things
+
+# Simulate a feeding frenzy (lots of flakes added and removed every tick) with and without the entity pool
+# Run from the repository root: python tools/benchmark_pool.py
+
+TICKS = 2000
+FLAKES_PER_TICK = 50
+LIVE_FLAKES = 5000
+
+def frenzy(pool_size):
+    random.seed(0)
+    aquarium = Aquarium(command_queue=queue.Queue(), user_manager=UserManager())
+    aquarium.pool.max_size = pool_size
+    live = []
+    gc.collect()
+    collections = sum(stat["collections"] for stat in gc.get_stats())
+    start = time.perf_counter()
+    for _ in range(TICKS):
+        aquarium.update(0.05) # Recycles last tick's removed objects
+        for _ in range(FLAKES_PER_TICK):
+            flake = aquarium.new_object("Flake", kwargs={"x": random.uniform(0, 900), "y": random.uniform(0, 500)})
+            aquarium.add_object(flake)
+            live.append(flake)
+        while len(live) > LIVE_FLAKES:
+            aquarium.remove_object(live.pop(0))
+        aquarium.broadcast_updates = []
+    elapsed = time.perf_counter() - start
+    collections = sum(stat["collections"] for stat in gc.get_stats()) - collections
+    return(elapsed, collections, aquarium.pool.reused)
+
+def labels():
+    aquarium = Aquarium(command_queue=queue.Queue(), user_manager=UserManager())
+    start = time.perf_counter()
+    for _ in range(100000):
+        str(uuid.uuid4())
+    uuid_time = time.perf_counter() - start
+    start = time.perf_counter()
+    for _ in range(100000):
+        aquarium.new_label()
+    counter_time = time.perf_counter() - start
+    print(f"labels | uuid4 {uuid_time * 10:.2f} us/label | counter {counter_time * 10:.2f} us/label")
+
+for name, pool_size in [("no pool", 0), ("pool", 1024)]:
+    elapsed, collections, reused = frenzy(pool_size)
+    print(f"{name:>7} | {elapsed / (TICKS * FLAKES_PER_TICK) * 1e6:6.2f} us/flake | "
+          f"{collections:5} gc collections | {reused} reused")
+labels()
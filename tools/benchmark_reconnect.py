@@ -0,0 +1,68 @@
+import sys, os
+sys.path.insert(0, os.getcwd())
+
+import queue, random, time
+from server.broadcast import Broadcaster, WireJSON
+from server.models.aquarium import Aquarium
+from server.models.fish import Guppy
+from server.models.user import UserManager
+import server.models.things
+
+# A reconnect storm: RECONNECTS clients connect over a few ticks while VIEWERS are already watching.
+# Compares resyncing everyone on every connect (what simulate.py used to do) with a snapshot for each new
+# client (Broadcaster.sync_to), counting the bytes every client receives.
+# Run from the repository root: python tools/benchmark_reconnect.py
+
+FISH_COUNT = 300
+VIEWERS = 50
+RECONNECTS = 40
+STORM_TICKS = 10 # The reconnects are spread over this many ticks
+SIMULATION_TICK = 0.05
+
+class CountingSocketIO():
+    # Stands in for flask_socketio.SocketIO: encodes each message once like the real one and counts the bytes
+    # every recipient gets (everyone's in the "json" room)
+    def __init__(self):
+        self.viewers = VIEWERS
+        self.bytes = 0
+        self.encode_time = 0
+
+    def emit(self, event, *args, namespace=None, to=None):
+        start = time.perf_counter()
+        packet = f"42{namespace},{WireJSON.dumps([event, *args], separators=(',', ':'))}"
+        self.encode_time += time.perf_counter() - start
+        self.bytes += len(packet) * (self.viewers if to in (None, "json") else 1)
+
+def run(name, targeted):
+    random.seed(0)
+    aquarium = Aquarium(command_queue=queue.Queue(), user_manager=UserManager())
+    for _ in range(FISH_COUNT):
+        fish = Guppy(aquarium)
+        fish.x, fish.y = fish._get_random_xy()
+        aquarium.add_object(fish)
+    socketio = CountingSocketIO()
+    broadcaster = Broadcaster(socketio)
+    broadcaster.sync_everything(aquarium, -1, formats=["json"])
+    socketio.bytes = 0
+    start = time.perf_counter()
+    for tick in range(STORM_TICKS):
+        aquarium.now += SIMULATION_TICK * 1000
+        aquarium.broadcast_updates = []
+        for thing in list(aquarium.awake.values()):
+            thing.update(SIMULATION_TICK)
+            if thing.should_broadcast():
+                aquarium.broadcast_updates.append(thing.summarize)
+        joining = [f"new{tick}-{i}" for i in range(RECONNECTS // STORM_TICKS)]
+        socketio.viewers += len(joining) # They're in the room as soon as they connect
+        if targeted:
+            broadcaster.send_updates(aquarium.broadcast_updates, tick)
+            for sid in joining:
+                broadcaster.sync_to(aquarium, sid, tick)
+        else:
+            broadcaster.sync_everything(aquarium, tick, formats=["json"])
+    elapsed = time.perf_counter() - start
+    print(f"{name:9} | {socketio.bytes / 1024 / 1024:6.1f} MiB sent to {socketio.viewers} clients | "
+          f"{elapsed / STORM_TICKS * 1e3:5.2f} ms per tick (Socket.IO's encoding {socketio.encode_time / STORM_TICKS * 1e3:.2f} ms)")
+
+run("resync", False)
+run("targeted", True)
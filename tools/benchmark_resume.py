@@ -0,0 +1,85 @@
+import sys, os
+sys.path.insert(0, os.getcwd())
+
+import queue, random, time
+from server.broadcast import Broadcaster, WireJSON
+from server.models.aquarium import Aquarium
+from server.models.fish import Guppy
+from server.models.user import UserManager
+import server.models.things
+
+# Clients that drop for a moment (OUTAGE_TICKS) and reconnect with their place in the stream.
+# Compares catching them up from the history (Broadcaster.resume) with sending each a snapshot (sync_to), and
+# keyframes every second (what simulate.py used to do) with the adaptive interval, counting the bytes sent.
+# A busy tank (guppies chasing flakes) sends a keyframe's worth of deltas every second, a quiet one doesn't.
+# Run from the repository root: python tools/benchmark_resume.py
+
+FISH_COUNT = 300
+VIEWERS = 50
+TICKS = 400 # 20 seconds of simulation
+RECONNECT_EVERY = 10 # ticks
+RECONNECTS = 5 # Clients that come back every RECONNECT_EVERY ticks
+OUTAGE_TICKS = 6
+SIMULATION_TICK = 0.05
+
+class CountingSocketIO():
+    # Stands in for flask_socketio.SocketIO: encodes each message once like the real one and counts the bytes
+    # everyone in the room (or the one client) gets
+    def __init__(self):
+        self.bytes = 0
+        self.catch_up_bytes = 0
+
+    def emit(self, event, *args, namespace=None, to=None):
+        packet = f"42{namespace},{WireJSON.dumps([event, *args], separators=(',', ':'))}"
+        if to in (None, "json"):
+            self.bytes += len(packet) * VIEWERS
+        else:
+            self.catch_up_bytes += len(packet)
+
+def run(name, resume, adaptive, busy):
+    random.seed(0)
+    aquarium = Aquarium(command_queue=queue.Queue(), user_manager=UserManager())
+    for _ in range(FISH_COUNT):
+        fish = Guppy(aquarium)
+        fish.x, fish.y = fish._get_random_xy()
+        fish.hunger = 0.5 if busy else 0
+        aquarium.add_object(fish)
+    socketio = CountingSocketIO()
+    broadcaster = Broadcaster(socketio)
+    positions = [] # (tick they come back, where they were)
+    start = time.perf_counter()
+    for tick in range(TICKS):
+        aquarium.now += SIMULATION_TICK * 1000
+        aquarium.broadcast_updates = []
+        if busy and (tick % 4 == 0):
+            aquarium.add_object(aquarium.new_object("Flake", kwargs={"x": random.uniform(0, 900), "y": random.uniform(0, 200)}))
+        aquarium.pool.recycle()
+        aquarium.timers.run_due(aquarium.now, aquarium.objects)
+        for thing in list(aquarium.awake.values()):
+            thing.update(SIMULATION_TICK)
+            if thing.should_broadcast():
+                aquarium.broadcast_updates.append(thing.summarize)
+        due = broadcaster.keyframe_due(aquarium) if adaptive else (aquarium.now - (broadcaster.last_keyframe_time or -1e9) >= 1000)
+        if due:
+            broadcaster.sync_everything(aquarium, tick, formats=["json"])
+        else:
+            broadcaster.send_updates(aquarium.broadcast_updates, tick)
+        if tick % RECONNECT_EVERY == 0:
+            positions += [(tick + OUTAGE_TICKS, {"stream": broadcaster.stream, "seq": broadcaster.seq})] * RECONNECTS
+        for back, position in [p for p in positions if p[0] == tick]:
+            if resume:
+                broadcaster.resume(aquarium, "sid", tick, position=position)
+            else:
+                broadcaster.sync_to(aquarium, "sid", tick)
+        positions = [p for p in positions if p[0] > tick]
+    elapsed = time.perf_counter() - start
+    seconds = TICKS * SIMULATION_TICK
+    print(f"{name:19} | {socketio.bytes / seconds / 1024 / 1024:5.2f} MiB/s to {VIEWERS} viewers | "
+          f"{socketio.catch_up_bytes / seconds / 1024:7.1f} KiB/s catching up | {elapsed / TICKS * 1e3:5.2f} ms per tick | "
+          f"{broadcaster.keyframes} keyframes, {broadcaster.resumed} resumed, {broadcaster.resume_fallbacks} needed a snapshot")
+
+for busy in (True, False):
+    print("busy tank" if busy else "quiet tank")
+    run("1s keyframes, sync", False, False, busy)
+    run("1s keyframes, resume", True, False, busy)
+    run("adaptive, resume", True, True, busy)
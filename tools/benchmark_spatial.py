@@ -0,0 +1,85 @@
+import importlib.util
+import math
+import random
+import time
+
+# Compare the Aquarium's spatial index against the old linear scan in Thing._find_closest
+# Run from the repository root: python tools/benchmark_spatial.py
+# (We load spatial.py directly so we don't have to import the whole server package / connect to Mongo)
+
+SPATIAL_PATH = "./server/models/spatial.py"
+AQUARIUM_WIDTH = 960
+AQUARIUM_HEIGHT = 540
+OBJECT_COUNTS = [100, 1000, 10000]
+QUERIES = 1000
+CLASS_HIERARCHIES = [
+    ["Thing", "Fish"],
+    ["Thing", "Food", "Flake"],
+    ["Thing", "Food", "Pellet"],
+    ["Thing", "Coin"],
+]
+
+spec = importlib.util.spec_from_file_location("spatial", SPATIAL_PATH)
+spatial = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(spatial)
+
+class FakeThing():
+    def __init__(self, label):
+        self.label = label
+        self.x = random.uniform(0, AQUARIUM_WIDTH)
+        self.y = random.uniform(0, AQUARIUM_HEIGHT)
+        self.width = random.uniform(10, 120)
+        self.height = self.width
+        self.class_hierarchy = random.choice(CLASS_HIERARCHIES)
+
+def linear_closest(objects, x, y, class_hierarchy, exclude):
+    # This is the old Thing._find_closest
+    closest = None
+    closest_distance = float("inf")
+    for obj in objects.values():
+        if obj.label == exclude:
+            continue
+        if not all([c in obj.class_hierarchy for c in class_hierarchy]):
+            continue
+        distance = math.sqrt((x - obj.x)**2 + (y - obj.y)**2)
+        if distance < closest_distance:
+            closest = obj
+            closest_distance = distance
+    return(closest, closest_distance)
+
+def benchmark(n_objects):
+    objects = {str(i): FakeThing(str(i)) for i in range(n_objects)}
+    index = spatial.SpatialHash()
+    for obj in objects.values():
+        index.insert(obj)
+    class_hierarchy = ["Thing", "Food", "Pellet"]
+    predicate = lambda obj: all([c in obj.class_hierarchy for c in class_hierarchy])
+    queries = random.sample(list(objects.values()), min(QUERIES, n_objects))
+
+    start = time.perf_counter()
+    linear_results = [linear_closest(objects, q.x, q.y, class_hierarchy, q.label) for q in queries]
+    linear_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    index_results = [index.nearest(q.x, q.y, predicate=predicate, exclude=q.label) for q in queries]
+    index_time = time.perf_counter() - start
+
+    # Make sure we get the same distances (ties may pick a different object)
+    for (_, linear_distance), (_, index_distance) in zip(linear_results, index_results):
+        assert math.isclose(linear_distance, index_distance), "Spatial index disagrees with the linear scan!"
+
+    # Moving every object once (what the simulation loop does every tick)
+    start = time.perf_counter()
+    for obj in objects.values():
+        obj.x = min(AQUARIUM_WIDTH, max(0, obj.x + random.uniform(-5, 5)))
+        obj.y = min(AQUARIUM_HEIGHT, max(0, obj.y + random.uniform(-5, 5)))
+        index.move(obj)
+    move_time = time.perf_counter() - start
+
+    print(f"{n_objects:>6} objects | linear {linear_time / len(queries) * 1e6:9.1f} us/query | "
+          f"grid {index_time / len(queries) * 1e6:7.1f} us/query | "
+          f"speedup {linear_time / index_time:6.1f}x | move all {move_time * 1e3:6.2f} ms")
+
+random.seed(0)
+for n_objects in OBJECT_COUNTS:
+    benchmark(n_objects)
@@ -0,0 +1,75 @@
+import sys, os
+sys.path.insert(0, os.getcwd())
+
+import queue, random, time
+from server.broadcast import Broadcaster, WireJSON
+from server.models.aquarium import Aquarium
+from server.models.fish import Guppy, Angelfish, Clownfish
+from server.models.user import UserManager
+import server.models.things
+
+# How long sync_everything takes to build and encode with and without the broadcast cache (ENCODE_ONCE in
+# server/broadcast.py) on a 500 object tank. Every tick is synced in both formats, and a few more viewers
+# connect in the same tick (each gets a sync of their own).
+# Run from the repository root: python tools/benchmark_sync_cache.py
+
+TICKS = 100
+WARM_UP_TICKS = 200
+SIMULATION_TICK = 0.05
+LATE_JOINERS = 3 # Extra syncs per tick
+TANK = {"Fish": 150, "Flake": 150, "Coin": 100, "Bubble": 80, "Tap": 15, "TreasureChest": 5}
+
+class EncodingSocketIO():
+    # Stands in for flask_socketio.SocketIO: encodes each message into a Socket.IO packet like the real one
+    # (configured with json=WireJSON) would, once per emit
+    def __init__(self):
+        self.bytes = 0
+
+    def emit(self, event, data, *args, namespace=None, to=None):
+        if isinstance(data, bytes):
+            self.bytes += len(data) # Binary attachments go out as they are
+        else:
+            self.bytes += len(f"42{namespace},{WireJSON.dumps([event, data, *args], separators=(',', ':'))}")
+
+def build():
+    random.seed(0)
+    aquarium = Aquarium(command_queue=queue.Queue(), user_manager=UserManager())
+    for i in range(TANK["Fish"]):
+        fish = random.choice([Guppy, Angelfish, Clownfish])(aquarium)
+        fish.x, fish.y = fish._get_random_xy()
+        aquarium.add_object(fish)
+    for class_name in ["Flake", "Coin", "Bubble", "TreasureChest"]:
+        for _ in range(TANK[class_name]):
+            aquarium.add_object(aquarium.new_object(class_name, kwargs={"x": random.uniform(0, 900), "y": random.uniform(0, 500)}))
+    for _ in range(TANK["Tap"]):
+        aquarium.add_object(aquarium.new_object("Tap", kwargs={"x": random.uniform(0, 900), "y": random.uniform(0, 500), "username": "user"}))
+    return(aquarium)
+
+def step(aquarium):
+    # Aquarium.update on a simulated clock
+    aquarium.now += SIMULATION_TICK * 1000
+    aquarium.pool.recycle()
+    aquarium.timers.run_due(aquarium.now, aquarium.objects)
+    for thing in list(aquarium.awake.values()):
+        thing.update(SIMULATION_TICK)
+
+def run(name, encode_once):
+    aquarium = build()
+    for _ in range(WARM_UP_TICKS): # Let the coins land and go to sleep
+        step(aquarium)
+    socketio = EncodingSocketIO()
+    broadcaster = Broadcaster(socketio, encode_once=encode_once)
+    sync_time = 0
+    for tick in range(TICKS):
+        step(aquarium)
+        start = time.perf_counter()
+        broadcaster.sync_everything(aquarium, tick, formats=["json", "packed"])
+        for _ in range(LATE_JOINERS):
+            broadcaster.sync_everything(aquarium, tick, formats=["json"])
+        sync_time += time.perf_counter() - start
+    print(f"{name:11} | {len(aquarium.objects)} objects, {len(aquarium.objects) - len(aquarium.awake)} asleep | "
+          f"{sync_time / TICKS * 1e3:5.2f} ms per tick for {2 + LATE_JOINERS} syncs (Socket.IO's encoding included) | "
+          f"broadcaster: {broadcaster.report()}")
+
+run("no cache", False)
+run("encode once", True)